@@ -0,0 +1,78 @@
+"""
+Admin notifications, run as background jobs: new specialist registrations,
+and uploads that failed verification (see storage.processing).
+
+A notification is always logged. With DR_SKIN_ADMIN_WEBHOOK_URL set it is
+also POSTed there as JSON (Slack/Teams-style incoming webhooks, or any
+endpoint of our own); a failed delivery is retried by the job worker.
+"""
+import json
+import os
+import urllib.request
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import AsyncSessionLocal
+from jobs.worker import job_handler
+from specialists.queries import get_specialist
+from storage.models import StoredFile
+
+NOTIFY_REGISTRATION_JOB = "auth.notify_specialist_registration"
+NOTIFY_REJECTED_UPLOAD_JOB = "auth.notify_rejected_upload"
+
+ADMIN_WEBHOOK_URL = os.environ.get("DR_SKIN_ADMIN_WEBHOOK_URL", "")
+ADMIN_WEBHOOK_TIMEOUT_SECONDS = float(
+    os.environ.get("DR_SKIN_ADMIN_WEBHOOK_TIMEOUT", "10")
+)
+
+def post_webhook(message: dict):
+    request = urllib.request.Request(
+        ADMIN_WEBHOOK_URL,
+        data=json.dumps(message).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=ADMIN_WEBHOOK_TIMEOUT_SECONDS):
+        pass
+
+@job_handler(NOTIFY_REGISTRATION_JOB)
+async def notify_specialist_registration(payload: dict):
+    async with AsyncSessionLocal() as db:
+        specialist = await get_specialist(db, payload["specialist_id"])
+    if specialist is None or specialist.is_approved:
+        # Already dealt with
+        return
+    text = (
+        f"New specialist registration awaiting review: {specialist.name} "
+        f"({specialist.user.username}, {specialist.specialization}, "
+        f"{specialist.hospital}), "
+        f"license {specialist.license_number}"
+    )
+    await notify_admins(text, specialist.id)
+
+@job_handler(NOTIFY_REJECTED_UPLOAD_JOB)
+async def notify_rejected_upload(payload: dict):
+    async with AsyncSessionLocal() as db:
+        stored = await db.get(StoredFile, payload["stored_file_id"])
+        specialist = (
+            await get_specialist(db, stored.specialist_id)
+            if stored is not None
+            else None
+        )
+    if specialist is None or stored.rejected_reason is None:
+        # Deleted, or replaced by a new upload since
+        return
+    text = (
+        f"The {stored.kind} file {stored.original_filename!r} uploaded by specialist "
+        f"{specialist.name} ({specialist.user.username}) failed verification and "
+        f"was removed from the profile: "
+        f"{stored.rejected_reason}"
+    )
+    await notify_admins(text, specialist.id)
+
+async def notify_admins(text: str, specialist_id: int):
+    print(f"[DrSkin] {text}")
+    if ADMIN_WEBHOOK_URL:
+        await run_in_threadpool(
+            post_webhook, {"text": text, "specialist_id": specialist_id}
+        )
@@ -0,0 +1,73 @@
+"""
+The authenticated user as seen by route dependencies.
+
+get_current_user used to load the User row on every authenticated request.
+It now returns a Principal, a plain snapshot of the user's columns cached by
+token subject for DR_SKIN_PRINCIPAL_CACHE_TTL seconds. Anything that changes
+a user's status (approval, rejection, deactivation, deletion) must call
+invalidate_user() after committing.
+
+With DR_SKIN_TRUST_TOKEN_CLAIMS=1, pure role checks (get_current_principal)
+trust the uid/user_type/status claims embedded at login and skip both the
+cache and the database. A role or status change then only takes effect when
+the user's token expires, so this is opt-in.
+"""
+import os
+from typing import Optional
+
+from auth.models import UserStatus, UserType
+from cache import LRUCache
+
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("DR_SKIN_PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("DR_SKIN_PRINCIPAL_CACHE_TTL", "30"))
+TRUST_TOKEN_CLAIMS = os.environ.get("DR_SKIN_TRUST_TOKEN_CLAIMS", "0") == "1"
+
+class Principal:
+    """Snapshot of a user's columns, safe to share between requests and sessions."""
+
+    __slots__ = (
+        "id",
+        "username",
+        "email",
+        "user_type",
+        "status",
+        "is_active",
+        "is_superuser",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(**{name: getattr(user, name) for name in cls.__slots__})
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> Optional["Principal"]:
+        """Principal from the token alone; None for tokens without role claims."""
+        if not all(key in claims for key in ("sub", "uid", "user_type", "status")):
+            return None
+        status = UserStatus(claims["status"])
+        return cls(
+            id=claims["uid"],
+            username=claims["sub"],
+            user_type=UserType(claims["user_type"]),
+            status=status,
+            is_active=status == UserStatus.ACTIVE,
+        )
+
+def token_claims(user) -> dict:
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "user_type": user.user_type.value,
+        "status": user.status.value,
+    }
+
+principal_cache = LRUCache(
+    maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS
+)
+
+def invalidate_user(username: str):
+    principal_cache.delete(username)
@@ -1,31 +1,46 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from auth import models
+from pagination import paginate
+from auth.principal import invalidate_user
+from typing import Optional
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.User).where(models.User.id == user_id))
+    return result.scalars().first()
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(models.User).where(models.User.username == username)
+    )
+    return result.scalars().first()
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+async def get_users(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+):
+    result = await db.execute(
+        paginate(select(models.User), models.User.id, skip, limit, after_id)
+    )
+    return result.scalars().all()
 
-def create_user(db: Session, user: models.User):
+async def create_user(db: AsyncSession, user: models.User):
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
-def update_user(db: Session, user: models.User):
-    db.commit()
-    db.refresh(user)
+async def update_user(db: AsyncSession, user: models.User):
+    await db.commit()
+    invalidate_user(user.username)
+    await db.refresh(user)
     return user
 
-def delete_user(db: Session, user: models.User):
-    db.delete(user)
-    db.commit()
-    return user 
\ No newline at end of file
+async def delete_user(db: AsyncSession, user: models.User):
+    await db.delete(user)
+    await db.commit()
+    invalidate_user(user.username)
+    return user
\ No newline at end of file
@@ -1,27 +1,45 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Form, UploadFile, File
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    status,
+    Form,
+    UploadFile,
+    File,
+)
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import models, schemas, queries, security, transactions
 from database import get_db
+from specialists.cache import specialist_cache
+from auth.principal import Principal, principal_cache, token_claims, TRUST_TOKEN_CLAIMS
+from dashboard.transactions import invalidate_dashboard_stats
+from auth.uploads import UploadTooLarge, stage_upload
+from storage.backends import file_storage
+from storage.serving import blob_source, path_source, serve_file
+from storage.queries import get_stored_file_by_name
+from jobs.worker import enqueue, job_worker
+from auth.notifications import NOTIFY_REGISTRATION_JOB
 import os
-import shutil
 from pathlib import Path
-from fastapi.responses import FileResponse
 from typing import Optional
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-# Create upload directory if it doesn't exist
+# Files uploaded before content-addressed storage, still served by name
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 LICENSE_DIR = UPLOAD_DIR / "licenses"
 LICENSE_DIR.mkdir(exist_ok=True)
 PROFILE_DIR = UPLOAD_DIR / "profiles"
 PROFILE_DIR.mkdir(exist_ok=True)
+MAX_LICENSE_BYTES = 5 * 1024 * 1024
+MAX_PROFILE_BYTES = 2 * 1024 * 1024
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -36,10 +54,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if username is None:
         raise credentials_exception
     
-    user = queries.get_user_by_username(db, username=username)
-    if user is None:
-        raise credentials_exception
-    return user
+    principal = principal_cache.get(username)
+    if principal is None:
+        user = await queries.get_user_by_username(db, username=username)
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        principal_cache.set(username, principal)
+    return principal
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+) -> Principal:
+    """
+    The current user for pure role checks (user_type/status/id).
+    Uses only the token's claims when DR_SKIN_TRUST_TOKEN_CLAIMS=1,
+    otherwise it is the same as get_current_user.
+    """
+    if TRUST_TOKEN_CLAIMS:
+        token_data = security.verify_token(token)
+        principal = Principal.from_claims(token_data) if token_data else None
+        if principal is not None:
+            return principal
+    return await get_current_user(token, db)
 
 async def validate_specialist_form_data(
     username: str = Form(...),
@@ -67,14 +104,16 @@ async def validate_specialist_form_data(
         )
         return form_data
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
 @router.post("/register", response_model=schemas.UserOut)
-async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     # Registers a specialist user. All new users are specialists and require admin approval.
-    db_user, error = transactions.create_user_transaction(db, user)
+    db_user, error = await transactions.create_user_transaction(db, user)
     if error:
         raise HTTPException(status_code=400, detail=error)
+    await db.commit()
+    invalidate_dashboard_stats()
     return db_user
 
 @router.post("/specialist-register", response_model=schemas.SpecialistRegistrationResponse)
@@ -82,7 +121,7 @@ async def register_specialist(
     form_data: schemas.SpecialistRegistrationForm = Depends(validate_specialist_form_data),
     license_file: UploadFile = File(...),
     profile_image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # just 3lshan n3dy l lela
     # allowed_image_types = ["zimage/jpeg", "image/png", "image/jpg"]
@@ -99,75 +138,70 @@ async def register_specialist(
     #         status_code=400, 
     #         detail="Profile image must be JPEG or PNG"
     #     )
-    
-    # Validate file sizes (5MB for documents, 2MB for images)
-    # Read file content to get size
-    license_content = await license_file.read()
-    if len(license_content) > 5 * 1024 * 1024:  # 5MB
-        raise HTTPException(
-            status_code=400, 
-            detail="License file must be less than 5MB"
-        )
-    
-    # Reset file pointer for later use
-    await license_file.seek(0)
-    
-    profile_content = None
-    if profile_image:
-        profile_content = await profile_image.read()
-        if len(profile_content) > 2 * 1024 * 1024:  # 2MB
-            raise HTTPException(
-                status_code=400, 
-                detail="Profile image must be less than 2MB"
+
+    # Stream uploads to temp files next to their final location, stopping at the
+    # size limit
+    staged = []
+    try:
+        try:
+            license_upload = await stage_upload(
+                license_file, file_storage.staging_dir, MAX_LICENSE_BYTES
             )
-        # Reset file pointer for later use
-        await profile_image.seek(0)
-    
-    # Create registration data
-    registration_data = schemas.SpecialistRegistration(
-        username=form_data.username,
-        email=form_data.email,
-        password=form_data.password,
-        name=form_data.name,
-        phone_number=form_data.phone_number,
-        license_number=form_data.license_number,
-        specialization=form_data.specialization,
-        hospital=form_data.hospital,
-        bio=form_data.bio
-    )
-    
-    # Create user and specialist profile (this will flush but not commit)
-    db_user, error = transactions.create_specialist_registration_transaction(db, registration_data)
-    if error:
-        raise HTTPException(status_code=400, detail=error)
-    
-    # Save license file
-    license_filename = f"license_{db_user.id}_{license_file.filename}"
-    license_path = LICENSE_DIR / license_filename
-    
-    with open(license_path, "wb") as buffer:
-        shutil.copyfileobj(license_file.file, buffer)
-    
-    # Save profile image if provided
-    profile_filename = None
-    profile_path = None
-    if profile_image:
-        profile_filename = f"profile_{db_user.id}_{profile_image.filename}"
-        profile_path = PROFILE_DIR / profile_filename
+        except UploadTooLarge as e:
+            raise HTTPException(
+                status_code=400, detail="License file must be less than 5MB"
+            ) from e
+        staged.append(license_upload)
         
-        with open(profile_path, "wb") as buffer:
-            shutil.copyfileobj(profile_image.file, buffer)
-    
-    # Update specialist profile with file paths (this will flush but not commit)
-    transactions.update_specialist_files_transaction(
-        db, 
-        db_user.id, 
-        str(license_path), 
-        str(profile_path) if profile_path else None
-    )
+        profile_upload = None
+        if profile_image:
+            try:
+                profile_upload = await stage_upload(
+                    profile_image, file_storage.staging_dir, MAX_PROFILE_BYTES
+                )
+            except UploadTooLarge as e:
+                raise HTTPException(
+                    status_code=400, detail="Profile image must be less than 2MB"
+                ) from e
+            staged.append(profile_upload)
+        
+        # Create registration data
+        registration_data = schemas.SpecialistRegistration(
+            username=form_data.username,
+            email=form_data.email,
+            password=form_data.password,
+            name=form_data.name,
+            phone_number=form_data.phone_number,
+            license_number=form_data.license_number,
+            specialization=form_data.specialization,
+            hospital=form_data.hospital,
+            bio=form_data.bio
+        )
+        
+        # Create user and specialist profile (this will flush but not commit)
+        db_user, error = await transactions.create_specialist_registration_transaction(
+            db, registration_data
+        )
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+
+        # Store the files by content hash and link them to the profile (this will
+        # flush but not commit)
+        specialist, _ = await transactions.update_specialist_files_transaction(
+            db, db_user.id, license_upload, profile_upload
+        )
+        # File checks, thumbnails and the admin notification happen after the response
+        await enqueue(db, NOTIFY_REGISTRATION_JOB, {"specialist_id": specialist.id})
+    finally:
+        # No-op for files already moved into storage
+        for upload in staged:
+            await upload.discard()
     
     # If everything succeeded, commit the transaction
-    db.commit()
+    await db.commit()
+    job_worker.wake()
+    # New (pending) specialists show up in is_approved=false listings
+    await specialist_cache.invalidate()
     
     return schemas.SpecialistRegistrationResponse(
         id=db_user.id,
@@ -181,14 +215,21 @@ async def register_specialist(
     )
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = queries.get_user_by_username(db, username=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await queries.get_user_by_username(db, username=form_data.username)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await security.verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash used an old bcrypt cost; upgrade it while we have the password
+        user.hashed_password = new_hash
+        await db.commit()
     
     # Check if user is active and approved
     if not user.is_active or user.status != models.UserStatus.ACTIVE:
@@ -199,41 +240,59 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        data={"sub": user.username, "user_type": user.user_type.value},
+        data=token_claims(user),
         expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.UserOut)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
     return current_user
 
+async def uploaded_file_source(
+    db: AsyncSession, kind: str, directory: Path, filename: str
+):
+    stored = await get_stored_file_by_name(db, kind, filename)
+    if stored:
+        return blob_source(stored)
+    
+    source = await path_source(directory / filename)
+    if source is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return source
+
 @router.get("/files/license/{filename}")
-async def get_license_file(filename: str, current_user: models.User = Depends(get_current_user)):
-    """Get license file - admin only"""
+async def get_license_file(
+    filename: str,
+    request: Request,
+    size: Optional[int] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get license file, or a preview of it with ?size= - admin only"""
     if current_user.user_type != models.UserType.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can access license files"
         )
     
-    file_path = LICENSE_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(file_path)
+    source = await uploaded_file_source(db, "license", LICENSE_DIR, filename)
+    return await serve_file(request, source, size)
 
 @router.get("/files/profile/{filename}")
-async def get_profile_image(filename: str, current_user: models.User = Depends(get_current_user)):
-    """Get profile image - admin only"""
+async def get_profile_image(
+    filename: str,
+    request: Request,
+    size: Optional[int] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get profile image, or a thumbnail of it with ?size= - admin only"""
     if current_user.user_type != models.UserType.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can access profile images"
         )
     
-    file_path = PROFILE_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(file_path) 
\ No newline at end of file
+    source = await uploaded_file_source(db, "profile", PROFILE_DIR, filename)
+    return await serve_file(request, source, size) 
\ No newline at end of file
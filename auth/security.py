@@ -1,5 +1,8 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from auth.models import UserType
@@ -9,7 +12,18 @@ SECRET_KEY = "your-secret-key-here"  # Change this in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor; hashes made with another cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.environ.get("DR_SKIN_BCRYPT_ROUNDS", "12"))
+# Threads dedicated to bcrypt. It releases the GIL, so this is how many hashes
+# run in parallel; further logins queue here instead of blocking the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get("DR_SKIN_PASSWORD_HASH_WORKERS", "2"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -17,6 +31,24 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def run_password_task(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, fn, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await run_password_task(get_password_hash, password)
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """(valid, new_hash); new_hash is set when the stored hash has outdated settings."""
+    return await run_password_task(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
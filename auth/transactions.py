@@ -1,23 +1,27 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import models, schemas
-from auth.security import get_password_hash
+from auth.security import get_password_hash_async
 from auth.queries import get_user_by_username, get_user_by_email
 from specialists import models as specialist_models
 from specialists.queries import get_specialist_by_user_id, get_specialist_by_phone_all
+from storage.transactions import store_upload_transaction
+from auth.uploads import StagedUpload
+from jobs.worker import enqueue
+from storage.processing import PROCESS_UPLOAD_JOB
 
-def create_user_transaction(db: Session, user: schemas.UserCreate):
+async def create_user_transaction(db: AsyncSession, user: schemas.UserCreate):
     # Check if username exists
-    existing_user = get_user_by_username(db, username=user.username)
+    existing_user = await get_user_by_username(db, username=user.username)
     if existing_user:
         return None, "Username already registered"
     
     # Check if email exists
-    existing_email = get_user_by_email(db, email=user.email)
+    existing_email = await get_user_by_email(db, email=user.email)
     if existing_email:
         return None, "Email already registered"
     
     # Create new specialist user (default for registration)
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -28,28 +32,30 @@ def create_user_transaction(db: Session, user: schemas.UserCreate):
         is_superuser=False
     )
     db.add(db_user)
-    db.flush()  # Get the ID without committing
-    db.refresh(db_user)
+    await db.flush()  # Get the ID without committing
+    await db.refresh(db_user)
     return db_user, None
 
-def create_specialist_registration_transaction(db: Session, registration: schemas.SpecialistRegistration):
+async def create_specialist_registration_transaction(db: AsyncSession, registration: schemas.SpecialistRegistration):
     # Check if username exists
-    existing_user = get_user_by_username(db, username=registration.username)
+    existing_user = await get_user_by_username(db, username=registration.username)
     if existing_user:
         return None, "Username already registered"
     
     # Check if email exists
-    existing_email = get_user_by_email(db, email=registration.email)
+    existing_email = await get_user_by_email(db, email=registration.email)
     if existing_email:
         return None, "Email already registered"
     
     # Check if phone number already exists
-    existing_specialist = get_specialist_by_phone_all(db, registration.phone_number)
+    existing_specialist = await get_specialist_by_phone_all(
+        db, registration.phone_number
+    )
     if existing_specialist:
         return None, "Phone number already registered"
     
     # Create new specialist user
-    hashed_password = get_password_hash(registration.password)
+    hashed_password = await get_password_hash_async(registration.password)
     db_user = models.User(
         username=registration.username,
         email=registration.email,
@@ -60,7 +66,7 @@ def create_specialist_registration_transaction(db: Session, registration: schema
         is_superuser=False
     )
     db.add(db_user)
-    db.flush()  # Get the user ID without committing
+    await db.flush()  # Get the user ID without committing
     
     # Create specialist profile
     db_specialist = specialist_models.Specialist(
@@ -74,22 +80,30 @@ def create_specialist_registration_transaction(db: Session, registration: schema
         is_approved=False
     )
     db.add(db_specialist)
-    db.flush()  # Get the specialist ID without committing
-    db.refresh(db_user)
-    db.refresh(db_specialist)
+    await db.flush()  # Get the specialist ID without committing
+    await db.refresh(db_user)
+    await db.refresh(db_specialist)
     
     return db_user, None
 
-def update_specialist_files_transaction(db: Session, user_id: int, license_file_path: str, profile_image_path: str = None):
-    """Update specialist profile with file paths after files are saved"""
-    specialist = get_specialist_by_user_id(db, user_id)
+async def update_specialist_files_transaction(db: AsyncSession, user_id: int, license_upload: StagedUpload, profile_upload: StagedUpload = None):
+    """Store the staged uploads, link them to the profile and queue their processing"""
+    specialist = await get_specialist_by_user_id(db, user_id)
     if not specialist:
         return None, "Specialist not found"
+
+    license = await store_upload_transaction(
+        db, specialist.id, "license", license_upload
+    )
+    specialist.license_file_path = f"licenses/{license.name}"
+    await enqueue(db, PROCESS_UPLOAD_JOB, {"stored_file_id": license.id})
+    if profile_upload:
+        profile = await store_upload_transaction(
+            db, specialist.id, "profile", profile_upload
+        )
+        specialist.profile_image = f"profiles/{profile.name}"
+        await enqueue(db, PROCESS_UPLOAD_JOB, {"stored_file_id": profile.id})
     
-    specialist.license_file_path = license_file_path
-    if profile_image_path:
-        specialist.profile_image = profile_image_path
-    
-    db.flush()  # Flush changes without committing
-    db.refresh(specialist)
+    await db.flush()  # Flush changes without committing
+    await db.refresh(specialist)
     return specialist, None 
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Streaming handling of uploaded registration files.
+
+An upload is staged by copying it in chunks to a temporary file next to its
+final directory, counting bytes and hashing as it goes, and giving up as
+soon as the size limit is passed. Disk I/O runs in the threadpool. Once the
+registration has succeeded the staged file is renamed into place with
+os.replace, so a file under uploads/ is never partially written.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("DR_SKIN_UPLOAD_CHUNK_KB", "256")) * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+class StagedUpload:
+    """An upload written to a temporary file, not yet moved into place."""
+
+    def __init__(
+        self,
+        temp_path: Path,
+        filename: str,
+        size: int,
+        sha256: str,
+        content_type: Optional[str] = None,
+    ):
+        self.temp_path = temp_path
+        # Only the final component of the client's name; never a path
+        self.filename = Path(filename or "upload").name
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+
+    async def commit(self, destination: Path) -> Path:
+        await run_in_threadpool(os.replace, self.temp_path, destination)
+        return destination
+
+    async def discard(self):
+        await run_in_threadpool(remove_quietly, self.temp_path)
+
+def remove_quietly(path: Path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def upload_size(upload: UploadFile) -> Optional[int]:
+    """Size of the spooled upload without reading it, if the file object can tell."""
+    try:
+        position = upload.file.tell()
+        size = upload.file.seek(0, os.SEEK_END)
+        upload.file.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+async def stage_upload(
+    upload: UploadFile, directory: Path, max_bytes: int
+) -> StagedUpload:
+    """Copy an upload to a temp file in directory; UploadTooLarge past max_bytes."""
+    size = upload_size(upload)
+    if size is not None and size > max_bytes:
+        raise UploadTooLarge(size)
+
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    temp_file = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+
+    def write_chunk(chunk: bytes):
+        digest.update(chunk)
+        temp_file.write(chunk)
+
+    try:
+        await upload.seek(0)
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(size)
+            await run_in_threadpool(write_chunk, chunk)
+        await run_in_threadpool(temp_file.close)
+    except BaseException:
+        temp_file.close()
+        await run_in_threadpool(remove_quietly, temp_name)
+        raise
+    return StagedUpload(
+        Path(temp_name), upload.filename, size, digest.hexdigest(), upload.content_type
+    )
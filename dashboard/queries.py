@@ -1,52 +1,63 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case
+from sqlalchemy.orm import joinedload
 from dashboard import models
+from auth.models import User
 from specialists.models import Specialist
-
-def get_admin(db: Session, admin_id: int):
-    return db.query(models.Admin).filter(models.Admin.id == admin_id).first()
-
-def get_admin_by_user_id(db: Session, user_id: int):
-    return db.query(models.Admin).filter(models.Admin.user_id == user_id).first()
-
-def get_admins(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Admin).offset(skip).limit(limit).all()
-
-def create_admin(db: Session, admin: models.Admin):
+from specialists.queries import specialists_query
+from pagination import paginate
+from typing import Optional
+
+def admins_query():
+    # AdminOut nests the user, and lazy loads can't run under an AsyncSession
+    return select(models.Admin).options(joinedload(models.Admin.user))
+
+async def get_admin(db: AsyncSession, admin_id: int):
+    result = await db.execute(admins_query().where(models.Admin.id == admin_id))
+    return result.scalars().first()
+
+async def get_admin_by_user_id(db: AsyncSession, user_id: int):
+    result = await db.execute(admins_query().where(models.Admin.user_id == user_id))
+    return result.scalars().first()
+
+async def get_admins(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+):
+    result = await db.execute(
+        paginate(admins_query(), models.Admin.id, skip, limit, after_id)
+    )
+    return result.scalars().all()
+
+async def create_admin(db: AsyncSession, admin: models.Admin):
     db.add(admin)
-    db.commit()
-    db.refresh(admin)
-    return admin
+    await db.commit()
+    return await get_admin(db, admin.id)
 
-def update_admin(db: Session, admin: models.Admin):
-    db.commit()
-    db.refresh(admin)
+async def update_admin(db: AsyncSession, admin: models.Admin):
+    await db.commit()
+    await db.refresh(admin)
     return admin
 
-def delete_admin(db: Session, admin: models.Admin):
-    db.delete(admin)
-    db.commit()
+async def delete_admin(db: AsyncSession, admin: models.Admin):
+    await db.delete(admin)
+    await db.commit()
     return admin
 
-def get_specialist(db: Session, specialist_id: int):
-    return db.query(Specialist).filter(Specialist.id == specialist_id).first()
-
-def get_dashboard_stats(db: Session):
-    # Get total specialists
-    total_specialists = db.query(models.Specialist).count()
-    
-    # Get approved specialists
-    approved_specialists = db.query(models.Specialist).filter(models.Specialist.is_approved == True).count()
-    
-    # Get pending specialists
-    pending_specialists = db.query(models.Specialist).filter(models.Specialist.is_approved == False).count()
-    
-    # Get total users
-    total_users = db.query(models.User).count()
-    
-    return {
-        "total_specialists": total_specialists,
-        "approved_specialists": approved_specialists,
-        "pending_specialists": pending_specialists,
-        "total_users": total_users
-    } 
\ No newline at end of file
+async def get_specialist(db: AsyncSession, specialist_id: int):
+    result = await db.execute(specialists_query().where(Specialist.id == specialist_id))
+    return result.scalars().first()
+
+async def get_dashboard_stats(db: AsyncSession):
+    # One statement: a single pass over specialists with conditional sums,
+    # plus the user count as a scalar subquery
+    approved = case((Specialist.is_approved == True, 1), else_=0)
+    pending = case((Specialist.is_approved == False, 1), else_=0)
+    result = await db.execute(
+        select(
+            select(func.count(User.id)).scalar_subquery().label("total_users"),
+            func.count(Specialist.id).label("total_specialists"),
+            func.coalesce(func.sum(approved), 0).label("approved_specialists"),
+            func.coalesce(func.sum(pending), 0).label("pending_specialists"),
+        ).select_from(Specialist)
+    )
+    return dict(result.one()._mapping)
\ No newline at end of file
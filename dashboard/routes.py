@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from dashboard import models, schemas, queries, transactions
 from database import get_db
-from auth.routes import get_current_user
-from auth.models import User, UserType
+from pagination import decode_cursor, split_page, set_next_page_headers
+from typing import Optional
+from auth.routes import get_current_user, get_current_principal
+from auth.principal import Principal, invalidate_user
+from auth.models import UserType
 from specialists.models import Specialist
 from specialists.schemas import SpecialistUpdate, SpecialistOut
+from specialists.cache import specialist_cache
 from auth.models import UserStatus
 from dashboard import queries as dashboard_queries, transactions as dashboard_transactions
-from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
-async def get_current_admin(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_current_admin(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(
             status_code=403,
@@ -29,7 +32,7 @@ async def get_current_admin(current_user: User = Depends(get_current_user), db:
 @router.get("/stats", response_model=schemas.DashboardStats)
 async def get_dashboard_stats(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(
@@ -37,7 +40,7 @@ async def get_dashboard_stats(
             detail="Only admin users can access dashboard stats"
         )
     
-    stats, error = await transactions.get_dashboard_data_transaction(db)
+    stats, error = await transactions.get_dashboard_stats_transaction(db)
     if error:
         raise HTTPException(status_code=400, detail=error)
     return stats
@@ -48,23 +51,33 @@ async def read_admin_me(current_admin: models.Admin = Depends(get_current_admin)
 
 @router.get("/admins", response_model=list[schemas.AdminOut])
 async def list_admins(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(
+        None, description="X-Next-Cursor from the previous page; replaces skip"
+    ),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal),
 ):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(
             status_code=403,
             detail="Only admin users can list admins"
         )
-    return await queries.get_admins(db, skip=skip, limit=limit)
+    admins = await queries.get_admins(
+        db, skip=skip, limit=limit + 1, after_id=decode_cursor(cursor)
+    )
+    page, next_cursor = split_page(admins, limit)
+    set_next_page_headers(request, response, next_cursor)
+    return page
 
 @router.get("/admins/{admin_id}", response_model=schemas.AdminOut)
 async def get_admin(
     admin_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(
@@ -78,33 +91,35 @@ async def get_admin(
     return admin 
 
 @router.patch("/specialists/{specialist_id}", response_model=SpecialistOut)
-def admin_update_specialist(
+async def admin_update_specialist(
     specialist_id: int,
     specialist_update: SpecialistUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin users can update specialists")
-    specialist, error = dashboard_transactions.update_specialist_transaction(db, specialist_id, specialist_update)
+    specialist, error = await dashboard_transactions.update_specialist_transaction(db, specialist_id, specialist_update)
     if error:
         raise HTTPException(status_code=400, detail=error)
     return specialist
 
 @router.post("/specialists/{specialist_id}/reject", response_model=SpecialistOut)
-def admin_reject_specialist(
+async def admin_reject_specialist(
     specialist_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin users can reject specialists")
-    specialist = dashboard_queries.get_specialist(db, specialist_id)
+    specialist = await dashboard_queries.get_specialist(db, specialist_id)
     if not specialist:
         raise HTTPException(status_code=404, detail="Specialist not found")
     specialist.is_approved = False
     specialist.user.status = UserStatus.INACTIVE
     specialist.user.is_active = False
-    db.commit()
-    db.refresh(specialist)
+    await db.commit()
+    await specialist_cache.invalidate(specialist.id)
+    invalidate_user(specialist.user.username)
+    await db.refresh(specialist)
     return specialist 
\ No newline at end of file
@@ -17,4 +17,7 @@ class AdminOut(AdminBase):
 class DashboardStats(BaseModel):
     total_users: int
     total_specialists: int
-    total_appointments: int 
\ No newline at end of file
+    approved_specialists: int
+    pending_specialists: int
+    # There is no appointments model yet
+    total_appointments: int = 0 
\ No newline at end of file
@@ -1,37 +1,55 @@
-from sqlalchemy.orm import Session
+import os
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import LRUCache
 from dashboard import models, schemas
-from dashboard.queries import get_dashboard_stats, get_admin_by_user_id
-from specialists.models import Specialist
+from dashboard.queries import (
+    get_dashboard_stats,
+    get_admin_by_user_id,
+    get_admin,
+    get_specialist,
+)
 from specialists.schemas import SpecialistUpdate
+from specialists.cache import specialist_cache
 from auth.models import UserStatus
-from sqlalchemy import select
 
-def create_admin_transaction(db: Session, admin: schemas.AdminCreate, user_id: int):
+# Admin dashboards poll /dashboard/stats; the counts only change on
+# registration, approval and rejection, which clear this cache
+DASHBOARD_STATS_TTL_SECONDS = float(os.environ.get("DR_SKIN_DASHBOARD_STATS_TTL", "30"))
+stats_cache = LRUCache(maxsize=1, ttl=DASHBOARD_STATS_TTL_SECONDS)
+specialist_cache.add_listener(stats_cache.clear)
+
+def invalidate_dashboard_stats():
+    stats_cache.clear()
+
+async def create_admin_transaction(
+    db: AsyncSession, admin: schemas.AdminCreate, user_id: int
+):
     # Check if user already has an admin profile
-    existing_admin = get_admin_by_user_id(db, user_id=user_id)
+    existing_admin = await get_admin_by_user_id(db, user_id=user_id)
     if existing_admin:
         return None, "User already has an admin profile"
     
     # Create new admin profile
     db_admin = models.Admin(**admin.dict(), user_id=user_id)
     db.add(db_admin)
-    db.commit()
-    db.refresh(db_admin)
-    return db_admin, None
-
-def get_specialist(db: Session, specialist_id: int):
-    return db.query(Specialist).filter(Specialist.id == specialist_id).first()
+    await db.commit()
+    return await get_admin(db, db_admin.id), None
 
-def update_specialist_transaction(db: Session, specialist_id: int, specialist_update: SpecialistUpdate):
-    specialist = get_specialist(db, specialist_id)
+async def update_specialist_transaction(db: AsyncSession, specialist_id: int, specialist_update: SpecialistUpdate):
+    specialist = await get_specialist(db, specialist_id)
     if not specialist:
         return None, "Specialist not found"
     update_data = specialist_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(specialist, field, value)
-    db.commit()
-    db.refresh(specialist)
+    await db.commit()
+    await specialist_cache.invalidate(specialist.id)
+    await db.refresh(specialist)
     return specialist, None
 
-def get_dashboard_stats_transaction(db: Session):
-    return get_dashboard_stats(db) 
\ No newline at end of file
+async def get_dashboard_stats_transaction(db: AsyncSession):
+    stats = stats_cache.get("stats")
+    if stats is None:
+        stats = await get_dashboard_stats(db)
+        stats_cache.set("stats", stats)
+    return stats, None
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+CPU inference backends for the diagnosis models.
+
+Every backend returns a callable taking a float32 NCHW tensor and returning
+logits, so predict_batch doesn't need to know which one it is running:
+
+- eager:        stock float32 torchvision model
+- dynamic_int8: eager model with int8 dynamically quantized Linear layers
+- torchscript:  traced and frozen TorchScript graph
+- static_int8:  FX static int8 quantization, calibrated and saved as TorchScript
+- onnx:         ONNX Runtime session (needs the optional onnxruntime package)
+
+static_int8 and onnx need an artifact created by scripts/export_models.py next
+to the .pth weights; torchscript uses one when present and traces otherwise.
+"""
+import os
+from typing import Callable, Iterable
+
+import numpy as np
+import torch
+
+BACKENDS = ("eager", "dynamic_int8", "torchscript", "static_int8", "onnx")
+DEFAULT_BACKEND = os.environ.get("DR_SKIN_MODEL_BACKEND", "eager")
+
+INPUT_SHAPE = (1, 3, 224, 224)
+
+_ARTIFACT_SUFFIXES = {
+    "torchscript": ".ts.pt",
+    "static_int8": ".int8.pt",
+    "onnx": ".onnx",
+}
+
+
+class BackendNotSupported(Exception):
+    """Raised when a backend is unknown or can't run in this environment."""
+
+
+def backend_for(model_name: str) -> str:
+    """Backend configured for a model, e.g. DR_SKIN_DENSENET_BACKEND=static_int8."""
+    backend = os.environ.get(f"DR_SKIN_{model_name.upper()}_BACKEND", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise BackendNotSupported(
+            f"Unknown backend '{backend}' for model '{model_name}'"
+        )
+    return backend
+
+
+def artifact_path(weights_path: str, backend: str) -> str:
+    """Path of the exported artifact for a backend, or the weights for eager ones."""
+    suffix = _ARTIFACT_SUFFIXES.get(backend)
+    if suffix is None:
+        return weights_path
+    return os.path.splitext(weights_path)[0] + suffix
+
+
+def requires_artifact(backend: str) -> bool:
+    return backend in ("static_int8", "onnx")
+
+
+class OnnxModel:
+    """Wraps an ONNX Runtime session so it can be called like a torch model."""
+
+    def __init__(self, path: str, intra_op_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise BackendNotSupported(
+                "The onnx backend requires the onnxruntime package"
+            ) from e
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        array = np.ascontiguousarray(input_tensor.numpy(), dtype=np.float32)
+        (logits,) = self.session.run(None, {self.input_name: array})
+        return torch.from_numpy(logits)
+
+
+def quantize_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    from torch.ao.quantization import quantize_dynamic as _quantize_dynamic
+
+    return _quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def to_torchscript(model: torch.nn.Module) -> torch.jit.ScriptModule:
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), torch.randn(*INPUT_SHAPE))
+    return torch.jit.freeze(traced)
+
+
+def quantize_static(
+    model: torch.nn.Module, calibration: Iterable[torch.Tensor]
+) -> torch.jit.ScriptModule:
+    """FX graph mode static int8 quantization, calibrated on the given batches."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    example = torch.randn(*INPUT_SHAPE)
+    prepared = prepare_fx(model.eval(), get_default_qconfig_mapping("x86"), (example,))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+        quantized = convert_fx(prepared)
+        traced = torch.jit.trace(quantized, example)
+    return torch.jit.freeze(traced.eval())
+
+
+def export_torchscript(model: torch.nn.Module, path: str) -> str:
+    torch.jit.save(to_torchscript(model), path)
+    return path
+
+
+def export_static_int8(
+    model: torch.nn.Module, path: str, calibration: Iterable[torch.Tensor]
+) -> str:
+    torch.jit.save(quantize_static(model, calibration), path)
+    return path
+
+
+def export_onnx(model: torch.nn.Module, path: str, opset_version: int = 18) -> str:
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                model.eval(),
+                (torch.randn(*INPUT_SHAPE),),
+                path,
+                input_names=["input"],
+                output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=opset_version,
+            )
+    except ImportError as e:
+        raise BackendNotSupported(f"ONNX export requires the onnx packages: {e}") from e
+    return path
+
+
+def load_backend(
+    backend: str,
+    weights_path: str,
+    load_eager: Callable[[], torch.nn.Module],
+) -> Callable[[torch.Tensor], torch.Tensor]:
+    """Build the inference callable for a backend."""
+    if backend == "eager":
+        return load_eager()
+    if backend == "dynamic_int8":
+        return quantize_dynamic(load_eager())
+    path = artifact_path(weights_path, backend)
+    if backend == "torchscript":
+        if os.path.exists(path):
+            scripted = torch.jit.load(path, map_location="cpu")
+        else:
+            scripted = to_torchscript(load_eager())
+        # Optimized graphs can't be serialized, so this happens at load time
+        return torch.jit.optimize_for_inference(scripted)
+    if backend == "static_int8":
+        return torch.jit.load(path, map_location="cpu")
+    if backend == "onnx":
+        return OnnxModel(path, intra_op_threads=torch.get_num_threads())
+    raise BackendNotSupported(f"Unknown backend '{backend}'")
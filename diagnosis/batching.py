@@ -0,0 +1,197 @@
+"""
+Dynamic micro-batching for diagnosis inference.
+
+Uploads that arrive within a short window are grouped and run through the
+model as one batched forward pass, then each caller gets its own result back.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from diagnosis.executor import inference_executor
+from diagnosis.metrics import (
+    BATCH_SIZE,
+    INFERENCE_STAGE_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    StageTimer,
+)
+from diagnosis.registry import model_registry
+from diagnosis.services import predict_batch
+
+# Largest number of images sent through the model in one forward pass
+MAX_BATCH_SIZE = int(os.environ.get("DR_SKIN_MAX_BATCH_SIZE", "16"))
+# How long the first request of a batch waits for others to join it
+MAX_BATCH_WAIT_MS = float(os.environ.get("DR_SKIN_MAX_BATCH_WAIT_MS", "5"))
+
+
+def predict_with_model(
+    model_name: str,
+    images: List[Image.Image],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    """
+    Run images through a registered model, at most MAX_BATCH_SIZE per forward pass.
+    The model is resolved on every call so the registry may load or evict in between.
+    """
+    start = time.perf_counter()
+    model = model_registry.get(model_name)
+    load_seconds = time.perf_counter() - start
+    INFERENCE_STAGE_SECONDS.observe(load_seconds, model=model_name, stage="load")
+    if timings is not None:
+        timings["load"] = timings.get("load", 0.0) + load_seconds
+    results = []
+    for start in range(0, len(images), MAX_BATCH_SIZE):
+        chunk = images[start:start + MAX_BATCH_SIZE]
+        chunk_timings: Dict[str, float] = {}
+        results.extend(predict_batch(chunk, model=model, timings=chunk_timings))
+        BATCH_SIZE.observe(len(chunk), model=model_name)
+        for stage, seconds in chunk_timings.items():
+            INFERENCE_STAGE_SECONDS.observe(seconds, model=model_name, stage=stage)
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + seconds
+    return results
+
+
+class _Pending:
+    __slots__ = ("image", "future", "timer", "enqueued_at")
+
+    def __init__(
+        self, image: Image.Image, future: asyncio.Future, timer: Optional[StageTimer]
+    ):
+        self.image = image
+        self.future = future
+        self.timer = timer
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Collects pending predictions for one model and runs them in batches."""
+
+    def __init__(
+        self,
+        model_name: str,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_BATCH_WAIT_MS,
+    ):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Future] = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_event_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def submit(
+        self, image: Image.Image, timer: Optional[StageTimer] = None
+    ) -> dict:
+        """
+        Queue an image for the next batch and wait for its prediction.
+        Queue wait and batch stage durations are added to timer if given.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait(_Pending(image, future, timer))
+        return await future
+
+    async def _collect(self) -> List[_Pending]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _infer(
+        self, images: List[Image.Image], timings: Optional[Dict[str, float]] = None
+    ) -> List[dict]:
+        return predict_with_model(self.model_name, images, timings)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (client disconnects) don't need a slot
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for item in batch:
+                QUEUE_WAIT_SECONDS.observe(
+                    started - item.enqueued_at, model=self.model_name
+                )
+                if item.timer is not None:
+                    item.timer.add(
+                        f"{self.model_name}-queue", started - item.enqueued_at
+                    )
+            timings: Dict[str, float] = {}
+            try:
+                try:
+                    results = await inference_executor.run(
+                        self._infer, [item.image for item in batch], timings
+                    )
+                except Exception as exc:
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(exc)
+                    continue
+                for item, result in zip(batch, results):
+                    if item.timer is not None:
+                        for stage, seconds in timings.items():
+                            item.timer.add(f"{self.model_name}-{stage}", seconds)
+                    if not item.future.done():
+                        item.future.set_result(result)
+            finally:
+                # The batch is off the queue, so close() can't reach it if this
+                # worker is cancelled mid-inference; its callers mustn't hang
+                for item in batch:
+                    if not item.future.done():
+                        item.future.cancel()
+
+    async def close(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        if self._queue is not None:
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if not item.future.done():
+                    item.future.cancel()
+        self._worker = None
+
+
+_batchers: Dict[str, MicroBatcher] = {}
+
+
+def get_batcher(model_name: str) -> MicroBatcher:
+    """Return the shared batcher for a model, creating it on first use."""
+    batcher = _batchers.get(model_name)
+    if batcher is None:
+        batcher = MicroBatcher(model_name)
+        _batchers[model_name] = batcher
+    return batcher
+
+
+async def shutdown():
+    """Stop all batch workers and cancel anything still queued."""
+    for batcher in list(_batchers.values()):
+        await batcher.close()
+    _batchers.clear()
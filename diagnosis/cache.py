@@ -0,0 +1,157 @@
+"""
+Prediction cache keyed by the hash of the uploaded bytes and the model version.
+
+Clients often retry or re-submit the same photo; a hit skips decoding and the
+forward pass entirely. Results live in an in-process LRU and, when
+DR_SKIN_DIAGNOSIS_CACHE_PATH is set, in a SQLite file shared by all workers on
+the host, with TTL and size-based eviction.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from cache import LRUCache
+
+MEMORY_CACHE_SIZE = int(os.environ.get("DR_SKIN_DIAGNOSIS_CACHE_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.environ.get("DR_SKIN_DIAGNOSIS_CACHE_TTL", str(24 * 3600)))
+DISK_CACHE_PATH = os.environ.get("DR_SKIN_DIAGNOSIS_CACHE_PATH")
+DISK_CACHE_MAX_MB = float(os.environ.get("DR_SKIN_DIAGNOSIS_CACHE_DISK_MB", "64"))
+
+
+def content_digest(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+
+class DiskCache:
+    """SQLite-backed key/value tier with TTL and a total size budget."""
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_predictions_accessed_at"
+            " ON predictions (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and row[1] + self.ttl < now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM predictions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE predictions SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictions"
+                " (key, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self._conn.execute(
+                "DELETE FROM predictions WHERE created_at < ?", (now - self.ttl,)
+            )
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM predictions"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM predictions ORDER BY accessed_at"
+        ):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM predictions WHERE key = ?", victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM predictions"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": count,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class PredictionCache:
+    def __init__(
+        self,
+        memory_size: int = MEMORY_CACHE_SIZE,
+        ttl: float = CACHE_TTL_SECONDS,
+        disk_path: Optional[str] = DISK_CACHE_PATH,
+        disk_max_mb: float = DISK_CACHE_MAX_MB,
+    ):
+        self.memory = LRUCache(maxsize=memory_size, ttl=ttl)
+        self.disk = (
+            DiskCache(disk_path, ttl, int(disk_max_mb * 1024 * 1024))
+            if disk_path
+            else None
+        )
+
+    @staticmethod
+    def key(digest: str, model_name: str, model_version: str) -> str:
+        return f"{model_name}:{model_version}:{digest}"
+
+    def get(self, key: str) -> Optional[dict]:
+        result = self.memory.get(key)
+        if result is None and self.disk is not None:
+            result = self.disk.get(key)
+            if result is not None:
+                self.memory.set(key, result)
+        return result
+
+    def set(self, key: str, result: dict):
+        self.memory.set(key, result)
+        if self.disk is not None:
+            self.disk.set(key, result)
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+prediction_cache = PredictionCache()
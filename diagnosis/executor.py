@@ -0,0 +1,105 @@
+"""
+Dedicated worker pool for CPU-bound diagnosis work.
+
+Image decoding, preprocessing and the forward pass run here instead of on the
+event loop, so auth and listing endpoints stay responsive while diagnoses run.
+torch releases the GIL inside its kernels, so a small thread pool is enough to
+keep the cores busy without paying for a copy of every model per process.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+import torch
+
+# Threads in the inference pool (each one can run a whole batch)
+INFERENCE_WORKERS = int(os.environ.get("DR_SKIN_INFERENCE_WORKERS", "1"))
+# torch intra-op threads, 0 keeps torch's default (one per core)
+TORCH_THREADS = int(os.environ.get("DR_SKIN_TORCH_THREADS", "0"))
+# Diagnosis requests allowed in flight before new ones are rejected with 503
+MAX_QUEUE_DEPTH = int(os.environ.get("DR_SKIN_INFERENCE_QUEUE_DEPTH", "64"))
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference pool already has too much work queued."""
+
+
+class InferenceExecutor:
+    def __init__(
+        self,
+        max_workers: int = INFERENCE_WORKERS,
+        torch_threads: int = TORCH_THREADS,
+        max_queue_depth: int = MAX_QUEUE_DEPTH,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.torch_threads = torch_threads
+        self.max_queue_depth = max(1, max_queue_depth)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        # Notified whenever slots are given back, for reserve(timeout=...)
+        self._slots_freed: Optional[asyncio.Condition] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            if self.torch_threads > 0:
+                # Process-wide setting, applies to every worker thread
+                torch.set_num_threads(self.torch_threads)
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="inference",
+            )
+        return self._pool
+
+    def _has_room(self, slots: int) -> bool:
+        return self._in_flight + slots <= self.max_queue_depth
+
+    @asynccontextmanager
+    async def reserve(self, slots: int = 1, timeout: Optional[float] = None):
+        """
+        Hold request slots (one per image) for the duration of a diagnosis.
+        Raises InferenceQueueFull when there aren't enough free slots, or with
+        a timeout, when none free up within that many seconds.
+        """
+        if not self._has_room(slots):
+            if not timeout:
+                raise InferenceQueueFull()
+            if self._slots_freed is None:
+                self._slots_freed = asyncio.Condition()
+            try:
+                async with self._slots_freed:
+                    await asyncio.wait_for(
+                        self._slots_freed.wait_for(lambda: self._has_room(slots)),
+                        timeout,
+                    )
+            except asyncio.TimeoutError as e:
+                raise InferenceQueueFull() from e
+        self._in_flight += slots
+        try:
+            yield
+        finally:
+            self._in_flight -= slots
+            if self._slots_freed is not None:
+                async with self._slots_freed:
+                    self._slots_freed.notify_all()
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run fn in the inference pool and wait for its result."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._get_pool(), functools.partial(fn, *args, **kwargs)
+        )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+inference_executor = InferenceExecutor()
@@ -0,0 +1,202 @@
+"""
+Asynchronous diagnosis jobs.
+
+POST /diagnosis/jobs answers at once with a job id; the diagnosis runs as a
+background job (see jobs.worker) on DR_SKIN_DIAGNOSIS_JOB_WORKERS workers of
+its own, which feed the same micro-batchers as the synchronous endpoint, and
+GET /diagnosis/jobs/{id} (optionally long-polling with ?wait=) returns the
+result.
+
+A job is a row in the jobs table and its image waits in file storage until
+the job ends, so any app process can answer for it and queued jobs survive
+a restart; all processes must share the database and the storage root (or
+bucket). At most DR_SKIN_DIAGNOSIS_JOB_QUEUE_SIZE jobs wait at a time; past
+that, submissions get a 503 instead of piling up. A job that meets a full
+inference queue waits up to DR_SKIN_DIAGNOSIS_JOB_SLOT_WAIT seconds for a
+slot and then fails. Finished jobs are deleted DR_SKIN_DIAGNOSIS_JOB_TTL
+seconds after they end.
+"""
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from jobs.models import Job, JobStatus
+from jobs.queries import get_job
+from jobs.worker import JobWorker, enqueue
+from storage.backends import file_storage
+
+DIAGNOSIS_JOB = "diagnosis.run"
+
+JOB_QUEUE_SIZE = int(os.environ.get("DR_SKIN_DIAGNOSIS_JOB_QUEUE_SIZE", "64"))
+# Jobs diagnosed at the same time; each one still batches with other requests
+JOB_WORKERS = int(os.environ.get("DR_SKIN_DIAGNOSIS_JOB_WORKERS", "4"))
+# How often to look for jobs submitted to other processes
+JOB_POLL_SECONDS = float(os.environ.get("DR_SKIN_DIAGNOSIS_JOB_POLL_SECONDS", "1"))
+JOB_RESULT_TTL_SECONDS = float(os.environ.get("DR_SKIN_DIAGNOSIS_JOB_TTL", "600"))
+# Longest a job waits for an inference slot before failing with 503
+SLOT_WAIT_SECONDS = float(os.environ.get("DR_SKIN_DIAGNOSIS_JOB_SLOT_WAIT", "60"))
+# Longest a GET may hold the connection waiting for the job to finish
+MAX_WAIT_SECONDS = float(os.environ.get("DR_SKIN_DIAGNOSIS_JOB_MAX_WAIT", "30"))
+# How often a long poll rechecks a job that another process is running
+WAIT_POLL_SECONDS = 0.5
+# Expired jobs are deleted at most this often, by whichever process takes a new one
+PURGE_INTERVAL_SECONDS = 60
+
+STATUS_NAMES = {
+    JobStatus.PENDING: "queued",
+    JobStatus.RUNNING: "running",
+    JobStatus.SUCCEEDED: "succeeded",
+    JobStatus.FAILED: "failed",
+}
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+class JobQueueFull(Exception):
+    """Raised when DR_SKIN_DIAGNOSIS_JOB_QUEUE_SIZE jobs are already waiting."""
+
+
+def input_key(token: str) -> str:
+    return f"diagnosis/{token[:2]}/{token}"
+
+
+def job_body(job: Job) -> dict:
+    """The API's view of a diagnosis job."""
+    payload = json.loads(job.payload)
+    # The row id alone would let anyone walk through other people's results
+    body = {"id": f"{job.id}-{payload['token']}", "status": STATUS_NAMES[job.status]}
+    if job.status in FINISHED:
+        result = json.loads(job.result) if job.result else None
+        if job.status == JobStatus.SUCCEEDED:
+            body["result"] = result
+        else:
+            body["error"] = result or {"status_code": 500, "detail": job.last_error}
+        # run_after is the submission time, as diagnosis jobs are never retried
+        body["duration_ms"] = round(
+            (job.finished_at - job.run_after).total_seconds() * 1000, 2
+        )
+    return body
+
+
+class DiagnosisJobQueue(JobWorker):
+    def __init__(
+        self,
+        max_queued: int = JOB_QUEUE_SIZE,
+        workers: int = JOB_WORKERS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        ttl: float = JOB_RESULT_TTL_SECONDS,
+    ):
+        super().__init__(
+            workers=workers, poll_seconds=poll_seconds, kinds=(DIAGNOSIS_JOB,)
+        )
+        self.max_queued = max(1, max_queued)
+        self.ttl = ttl
+        # Set when a job run by this process finishes, so local long polls return
+        # at once
+        self._finished = weakref.WeakValueDictionary()
+        self._last_purge = 0.0
+
+    async def submit(self, db: AsyncSession, contents: bytes, model_type: str) -> Job:
+        """Queue a diagnosis of an image; raises JobQueueFull when the queue is full."""
+        result = await db.execute(
+            select(func.count(Job.id)).where(
+                Job.kind == DIAGNOSIS_JOB, Job.status == JobStatus.PENDING
+            )
+        )
+        if result.scalar() >= self.max_queued:
+            raise JobQueueFull()
+        token = secrets.token_hex(16)
+        await file_storage.put_bytes(input_key(token), contents)
+        await self.purge_expired(db)
+        job = await enqueue(
+            db,
+            DIAGNOSIS_JOB,
+            {"token": token, "model_type": model_type},
+            max_attempts=1,
+        )
+        await db.commit()
+        self.wake()
+        return job
+
+    async def get(self, db: AsyncSession, job_id: str) -> Optional[Job]:
+        """The job with this public id, unless it doesn't exist or has expired."""
+        row_id, _, token = job_id.partition("-")
+        if not row_id.isdigit():
+            return None
+        job = await get_job(db, int(row_id))
+        if job is None or job.kind != DIAGNOSIS_JOB:
+            return None
+        if not hmac.compare_digest(json.loads(job.payload)["token"], token):
+            return None
+        if job.status in FINISHED and job.finished_at < datetime.utcnow() - timedelta(
+            seconds=self.ttl
+        ):
+            return None
+        return job
+
+    async def wait(self, db: AsyncSession, job: Job, timeout: float) -> Job:
+        """The job, reloaded once it has finished or timeout seconds have passed."""
+        if job.status in FINISHED or timeout <= 0:
+            return job
+        # Hand the request's connection back to the pool for the wait; each
+        # recheck reads the row in a session of its own
+        await db.commit()
+        deadline = time.monotonic() + timeout
+        while job.status not in FINISHED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            finished = self._finished.get(job.id)
+            if finished is None:
+                finished = self._finished[job.id] = asyncio.Event()
+            try:
+                await asyncio.wait_for(
+                    finished.wait(), min(remaining, WAIT_POLL_SECONDS)
+                )
+            except asyncio.TimeoutError:
+                pass
+            async with AsyncSessionLocal() as session:
+                current = await get_job(session, job.id)
+            if current is None:
+                break
+            job = current
+        return job
+
+    async def purge_expired(self, db: AsyncSession):
+        """Delete jobs finished over ttl seconds ago (in the caller's transaction)."""
+        if time.monotonic() - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = time.monotonic()
+        await db.execute(
+            delete(Job).where(
+                Job.kind == DIAGNOSIS_JOB,
+                Job.status.in_(FINISHED),
+                Job.finished_at < datetime.utcnow() - timedelta(seconds=self.ttl),
+            )
+        )
+
+    async def finish(
+        self,
+        job: Job,
+        error: Optional[BaseException] = None,
+        result: Optional[dict] = None,
+    ) -> JobStatus:
+        status = await super().finish(job, error, result)
+        if status in FINISHED:
+            await file_storage.delete(input_key(json.loads(job.payload)["token"]))
+            finished = self._finished.pop(job.id, None)
+            if finished is not None:
+                finished.set()
+        return status
+
+
+diagnosis_jobs = DiagnosisJobQueue()
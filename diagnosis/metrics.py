@@ -0,0 +1,107 @@
+"""
+Timing and throughput instrumentation for the diagnosis path.
+
+Request-level stages (upload read, hashing, cache lookup, decode, queue wait)
+and per-batch inference stages (preprocess, forward, postprocess) feed
+histograms exposed at /metrics. A StageTimer also collects the stages of one
+request so they can be returned as a Server-Timing header.
+"""
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from diagnosis.cache import prediction_cache
+from diagnosis.executor import inference_executor
+from diagnosis.registry import model_registry
+from metrics import counter, gauge, histogram
+
+# Add a Server-Timing header with per-stage durations to diagnosis responses
+SERVER_TIMING_ENABLED = os.environ.get("DR_SKIN_SERVER_TIMING", "0") == "1"
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+REQUEST_STAGE_SECONDS = histogram(
+    "dr_skin_diagnosis_request_stage_seconds",
+    "Time spent in each request-level stage of a diagnosis.",
+    ["stage"],
+)
+INFERENCE_STAGE_SECONDS = histogram(
+    "dr_skin_diagnosis_inference_stage_seconds",
+    "Time spent in each stage of a batched model run.",
+    ["model", "stage"],
+)
+QUEUE_WAIT_SECONDS = histogram(
+    "dr_skin_diagnosis_queue_wait_seconds",
+    "Time an image waited in the micro-batch queue before its batch started.",
+    ["model"],
+)
+BATCH_SIZE = histogram(
+    "dr_skin_diagnosis_batch_size",
+    "Number of images per forward pass.",
+    ["model"],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+PREDICTIONS = counter(
+    "dr_skin_diagnosis_predictions_total",
+    "Predictions returned, by model and whether they came from the cache or the model.",
+    ["model", "source"],
+)
+REJECTED = counter(
+    "dr_skin_diagnosis_rejected_total",
+    "Diagnosis requests rejected with 503 because the inference queue was full.",
+)
+gauge(
+    "dr_skin_diagnosis_in_flight",
+    "Images currently holding an inference slot.",
+    function=lambda: {(): inference_executor.in_flight},
+)
+gauge(
+    "dr_skin_diagnosis_models_resident_bytes",
+    "Approximate memory used by each loaded model.",
+    ["model"],
+    function=lambda: {
+        (entry["name"],): entry["size_bytes"] for entry in model_registry.resident()
+    },
+)
+counter(
+    "dr_skin_diagnosis_cache_lookups_total",
+    "Prediction cache lookups by tier and result.",
+    ["tier", "result"],
+    function=lambda: {
+        (tier, result): stats[key]
+        for tier, stats in prediction_cache.stats().items() if stats is not None
+        for result, key in (("hit", "hits"), ("miss", "misses"))
+    },
+)
+
+
+class StageTimer:
+    """Durations of the stages of one diagnosis request, in order."""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(name, elapsed)
+            REQUEST_STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def add(self, name: str, seconds: float):
+        """Record a duration measured elsewhere (e.g. for the whole batch)."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()
+        )
+
+
+def apply_server_timing(response, timer: StageTimer):
+    if SERVER_TIMING_ENABLED and timer.stages:
+        response.headers["Server-Timing"] = timer.server_timing()
@@ -0,0 +1,94 @@
+"""
+Image decoding and preprocessing for the diagnosis models.
+
+Phone photos are often 12MP or more, so decoding at full resolution and then
+resizing to 224x224 costs more than the forward pass. JPEGs are decoded with
+PIL's draft mode (DCT downscaling), other formats are box-reduced before the
+final bilinear resize, and normalization writes straight into a preallocated,
+per-thread batch tensor instead of going tensor -> numpy -> tensor.
+"""
+import io
+import threading
+from typing import List, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+INPUT_SIZE: Tuple[int, int] = (224, 224)
+NORMALIZE_MEAN = np.array([0.77148203, 0.55764165, 0.58345652], dtype=np.float32)
+NORMALIZE_STD = np.array([0.12655577, 0.14245141, 0.15189891], dtype=np.float32)
+
+# Draft decoding keeps at least this multiple of the input size, so the final
+# bilinear resize still has enough pixels to average over
+DRAFT_OVERSAMPLE = 2
+# Passed to Image.resize: reduce by whole factors first when the source is
+# much larger than the target (see the Pillow docs for reducing_gap)
+RESIZE_REDUCING_GAP = 3.0
+# Part of every model version (and so of every prediction cache key); bump it
+# whenever a change here alters the pixels the models see. 1 was the original
+# torchvision val_test_transform, 2 is draft decoding with reducing_gap.
+PREPROCESS_VERSION = 2
+
+# (x / 255 - mean) / std folded into one multiply and one add per channel
+_SCALE = (1.0 / (255.0 * NORMALIZE_STD)).reshape(3, 1, 1)
+_OFFSET = (-NORMALIZE_MEAN / NORMALIZE_STD).reshape(3, 1, 1)
+
+
+def decode_image(contents: bytes, size: Tuple[int, int] = INPUT_SIZE) -> Image.Image:
+    """Decode upload bytes into an RGB image already resized to the model input size."""
+    image = Image.open(io.BytesIO(contents))
+    if image.format == "JPEG":
+        image.draft("RGB", (size[0] * DRAFT_OVERSAMPLE, size[1] * DRAFT_OVERSAMPLE))
+    return resize_image(image.convert("RGB"), size)
+
+
+def resize_image(image: Image.Image, size: Tuple[int, int] = INPUT_SIZE) -> Image.Image:
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size == size:
+        return image
+    return image.resize(size, Image.BILINEAR, reducing_gap=RESIZE_REDUCING_GAP)
+
+
+def normalize_into(image: Image.Image, out: np.ndarray) -> np.ndarray:
+    """Write the normalized CHW float32 form of a model-sized RGB image into out."""
+    chw = np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+    np.multiply(chw, _SCALE, out=out, casting="unsafe")
+    out += _OFFSET
+    return out
+
+
+class BatchBuffer(threading.local):
+    """Per-thread input tensor, grown on demand and reused between batches."""
+
+    def __init__(self, size: Tuple[int, int] = INPUT_SIZE):
+        self.size = size
+        self.tensor = torch.empty(0, 3, size[1], size[0])
+
+    def get(self, batch_size: int) -> torch.Tensor:
+        if self.tensor.shape[0] < batch_size:
+            self.tensor = torch.empty(batch_size, 3, self.size[1], self.size[0])
+        return self.tensor[:batch_size]
+
+
+_batch_buffer = BatchBuffer()
+
+
+def to_batch_tensor(images: List[Image.Image]) -> torch.Tensor:
+    """
+    Normalize images into this thread's batch buffer and return a view of it.
+    The view is overwritten by the next call on the same thread.
+    """
+    batch = _batch_buffer.get(len(images))
+    array = batch.numpy()
+    for index, image in enumerate(images):
+        normalize_into(resize_image(image), array[index])
+    return batch
+
+
+def preprocess_image(image: Image.Image) -> np.ndarray:
+    """Single image as a (1, 3, H, W) float32 array."""
+    out = np.empty((1, 3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.float32)
+    normalize_into(resize_image(image), out[0])
+    return out
@@ -0,0 +1,208 @@
+"""
+On-demand model loading for diagnosis.
+
+Models are built and loaded the first time they are requested (or when warmed
+up at startup) and kept in an LRU under a memory budget, so a worker only pays
+for the models it actually serves.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import torch
+
+from diagnosis.backends import (
+    artifact_path,
+    backend_for,
+    load_backend,
+    requires_artifact,
+)
+from diagnosis.preprocessing import PREPROCESS_VERSION
+from diagnosis.services import (
+    DEFAULT_CLASS_NAMES,
+    MODEL_PATH,
+    RESNET_MODEL_PATH,
+    build_densenet,
+    build_resnet,
+    load_model,
+)
+
+# Memory budget for resident models in MB, 0 means no limit
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get("DR_SKIN_MODEL_MEMORY_MB", "0"))
+# Comma separated model names to load at startup, e.g. "densenet,resnet"
+WARM_MODELS = [
+    name.strip()
+    for name in os.environ.get("DR_SKIN_WARM_MODELS", "").split(",")
+    if name.strip()
+]
+
+
+class ModelNotAvailable(Exception):
+    """Raised when a model is unknown or its weights are missing."""
+
+
+class ModelSpec:
+    def __init__(
+        self,
+        name: str,
+        display_name: str,
+        path: str,
+        builder: Callable[[int], torch.nn.Module],
+        num_classes: int = len(DEFAULT_CLASS_NAMES),
+        backend: Optional[str] = None,
+    ):
+        self.name = name
+        self.display_name = display_name
+        self.path = path
+        self.builder = builder
+        self.num_classes = num_classes
+        self.backend = backend or backend_for(name)
+
+    def load_eager(self) -> torch.nn.Module:
+        return load_model(self.path, self.num_classes, builder=self.builder)
+
+    def load(self):
+        return load_backend(self.backend, self.path, self.load_eager)
+
+    @property
+    def source_path(self) -> str:
+        """File the configured backend loads from."""
+        exported = artifact_path(self.path, self.backend)
+        if requires_artifact(self.backend) or os.path.exists(exported):
+            return exported
+        return self.path
+
+    def source_exists(self) -> bool:
+        return os.path.exists(self.source_path)
+
+    @property
+    def version(self) -> str:
+        """Changes whenever the backend, its source file or the preprocessing does."""
+        stat = os.stat(self.source_path)
+        return (
+            f"{self.backend}-{int(stat.st_mtime)}-{stat.st_size}-p{PREPROCESS_VERSION}"
+        )
+
+
+class _LoadedModel:
+    def __init__(self, model, size_bytes: int):
+        self.model = model
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+
+def model_size_bytes(model) -> int:
+    """
+    Approximate resident size of a model from its parameters and buffers.
+    Returns 0 for models that don't expose them (frozen graphs, ONNX sessions).
+    """
+    if not isinstance(model, torch.nn.Module):
+        return 0
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        specs: Iterable[ModelSpec],
+        memory_budget_mb: float = MODEL_MEMORY_BUDGET_MB,
+    ):
+        self._specs: Dict[str, ModelSpec] = {spec.name: spec for spec in specs}
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._loaded: "OrderedDict[str, _LoadedModel]" = OrderedDict()
+        # Guards _loaded; held only to look up, insert or evict, never while loading
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {
+            name: threading.Lock() for name in self._specs
+        }
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def spec(self, name: str) -> ModelSpec:
+        spec = self._specs.get(name)
+        if spec is None:
+            raise ModelNotAvailable(f"Unknown model: {name}")
+        return spec
+
+    def is_available(self, name: str) -> bool:
+        spec = self._specs.get(name)
+        return spec is not None and (name in self._loaded or spec.source_exists())
+
+    def _touch(self, name: str) -> Optional[_LoadedModel]:
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                entry.last_used = time.time()
+            return entry
+
+    def get(self, name: str):
+        """Return a loaded model, loading it (and evicting others) if needed."""
+        spec = self.spec(name)
+        entry = self._touch(name)
+        if entry is not None:
+            return entry.model
+        # Loads take seconds; only callers of this model wait for it, while
+        # _lock (also taken by resident() on the event loop) stays free
+        with self._load_locks[name]:
+            entry = self._touch(name)
+            if entry is not None:
+                return entry.model
+            if not spec.source_exists():
+                raise ModelNotAvailable(f"{spec.display_name} model not available.")
+            model = spec.load()
+            size_bytes = model_size_bytes(model) or os.path.getsize(spec.source_path)
+            with self._lock:
+                self._loaded[name] = _LoadedModel(model, size_bytes)
+                self._evict(keep=name)
+            return model
+
+    def _evict(self, keep: str):
+        if self.memory_budget_bytes <= 0:
+            return
+        while self.resident_bytes() > self.memory_budget_bytes:
+            victim = next((name for name in self._loaded if name != keep), None)
+            if victim is None:
+                break
+            del self._loaded[victim]
+
+    def unload(self, name: str) -> bool:
+        with self._lock:
+            return self._loaded.pop(name, None) is not None
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> List[str]:
+        """Load the given models (all available ones by default)."""
+        loaded = []
+        for name in names if names is not None else self.names():
+            if self.is_available(name):
+                self.get(name)
+                loaded.append(name)
+        return loaded
+
+    def resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._loaded.values())
+
+    def resident(self) -> List[dict]:
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "backend": self._specs[name].backend,
+                    "size_bytes": entry.size_bytes,
+                    "size_mb": round(entry.size_bytes / (1024 * 1024), 1),
+                    "loaded_at": entry.loaded_at,
+                    "last_used": entry.last_used,
+                }
+                for name, entry in self._loaded.items()
+            ]
+
+
+model_registry = ModelRegistry([
+    ModelSpec("densenet", "DenseNet", MODEL_PATH, build_densenet),
+    ModelSpec("resnet", "ResNet", RESNET_MODEL_PATH, build_resnet),
+])
@@ -1,27 +1,418 @@
-from fastapi import APIRouter, UploadFile, File, Query, HTTPException
-from PIL import Image
-import io
-from diagnosis.services import predict, DiagnosisClass, DEFAULT_MODEL, DEFAULT_RESNET_MODEL
+from fastapi import (
+    APIRouter,
+    Depends,
+    UploadFile,
+    File,
+    Query,
+    HTTPException,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import math
+import os
+import time
+from diagnosis.services import DiagnosisClass, aggregate_predictions
+from diagnosis.preprocessing import decode_image
+from diagnosis.batching import get_batcher, predict_with_model
+from diagnosis.executor import inference_executor, InferenceQueueFull
+from diagnosis.registry import model_registry, ModelNotAvailable
+from diagnosis.cache import prediction_cache, content_digest
+from diagnosis.jobs import (
+    DIAGNOSIS_JOB,
+    FINISHED,
+    MAX_WAIT_SECONDS,
+    SLOT_WAIT_SECONDS,
+    JobQueueFull,
+    diagnosis_jobs,
+    input_key,
+    job_body,
+)
+from diagnosis.metrics import PREDICTIONS, REJECTED, StageTimer, apply_server_timing
+from database import get_db
+from auth.principal import Principal
+from dependencies import require_admin
+from jobs.worker import PermanentJobError, job_handler
+from storage.backends import file_storage
 
 router = APIRouter(prefix="/diagnosis", tags=["diagnosis"])
 
+# Most images accepted by a single /diagnosis/batch request
+MAX_BATCH_FILES = int(os.environ.get("DR_SKIN_MAX_BATCH_FILES", "16"))
+
+def parse_ensemble_weights(value: str, model_names: List[str]) -> Dict[str, float]:
+    """
+    Parse "densenet:0.6,resnet:0.4"; models without a weight get 1.0.
+    Raises ValueError unless every weight is a finite number >= 0 and at
+    least one of model_names ends up with a weight above 0.
+    """
+    weights = {}
+    for item in value.split(","):
+        if ":" in item:
+            name, weight = item.split(":", 1)
+            try:
+                weights[name.strip()] = float(weight)
+            except ValueError as e:
+                raise ValueError(
+                    f"DR_SKIN_ENSEMBLE_WEIGHTS: weight for {name.strip()!r} "
+                    f"is not a number: {weight!r}"
+                ) from e
+            if not math.isfinite(weights[name.strip()]) or weights[name.strip()] < 0:
+                raise ValueError(
+                    f"DR_SKIN_ENSEMBLE_WEIGHTS: weight for {name.strip()!r} "
+                    "must be a finite number >= 0"
+                )
+    if not any(weights.get(name, 1.0) > 0 for name in model_names):
+        raise ValueError(
+            "DR_SKIN_ENSEMBLE_WEIGHTS: at least one model needs a weight above 0"
+        )
+    return weights
+
+# Relative weight of each model's probabilities in ensemble mode
+ENSEMBLE_WEIGHTS = parse_ensemble_weights(
+    os.environ.get("DR_SKIN_ENSEMBLE_WEIGHTS", ""), model_registry.names()
+)
+
+def require_model(model_name: str):
+    if not model_registry.is_available(model_name):
+        display_name = model_registry.spec(model_name).display_name
+        raise HTTPException(
+            status_code=500,
+            detail=f"{display_name} model not available.",
+        )
+
+def service_busy() -> HTTPException:
+    REJECTED.inc()
+    return HTTPException(
+        status_code=503,
+        detail="Diagnosis service is busy, please try again shortly.",
+        headers={"Retry-After": "1"},
+    )
+
+def decode_images(uploads: List[bytes]) -> list:
+    """Decode several uploads, reporting which one (if any) is not an image."""
+    images = []
+    for index, contents in enumerate(uploads):
+        try:
+            images.append(decode_image(contents))
+        except Exception as e:
+            raise ValueError(index) from e
+    return images
+
+def cached_predictions(keys: List[str]) -> list:
+    return [prediction_cache.get(key) for key in keys]
+
+def store_predictions(keys: List[str], predictions: List[dict]):
+    for key, prediction in zip(keys, predictions):
+        prediction_cache.set(key, prediction)
+
+def model_names_for(model_type: str) -> List[str]:
+    model_names = model_registry.names() if model_type == "ensemble" else [model_type]
+    for model_name in model_names:
+        require_model(model_name)
+    return model_names
+
+async def diagnose_contents(
+    contents: bytes,
+    model_type: str,
+    timer: StageTimer,
+    slot_timeout: Optional[float] = None,
+) -> dict:
+    """
+    Diagnose one uploaded image; shared by the synchronous endpoint and diagnosis jobs.
+    Raises InferenceQueueFull when no inference slot is free (within slot_timeout
+    seconds, if given).
+    """
+    model_names = model_names_for(model_type)
+    with timer.stage("hash"):
+        digest = await run_in_threadpool(content_digest, contents)
+    keys = [
+        prediction_cache.key(
+            digest, model_name, model_registry.spec(model_name).version
+        )
+        for model_name in model_names
+    ]
+    with timer.stage("cache"):
+        cached = await run_in_threadpool(cached_predictions, keys)
+    results = {
+        name: result for name, result in zip(model_names, cached) if result is not None
+    }
+    for name in results:
+        PREDICTIONS.inc(model=name, source="cache")
+    latencies = {name: 0.0 for name in results}
+    missing = [name for name in model_names if name not in results]
+    if missing:
+        try:
+            async with inference_executor.reserve(timeout=slot_timeout):
+                try:
+                    with timer.stage("decode"):
+                        image = await inference_executor.run(decode_image, contents)
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=400, detail="Invalid image file"
+                    ) from e
+
+                async def run_model(model_name: str) -> dict:
+                    start = time.perf_counter()
+                    result = await get_batcher(model_name).submit(image, timer=timer)
+                    latencies[model_name] = (time.perf_counter() - start) * 1000
+                    return result
+
+                # Each model has its own batcher, so both can be in flight at once
+                predictions = await asyncio.gather(
+                    *[run_model(name) for name in missing]
+                )
+        except ModelNotAvailable as e:
+            raise HTTPException(status_code=500, detail=str(e)) from e
+        results.update(zip(missing, predictions))
+        for name in missing:
+            PREDICTIONS.inc(model=name, source="model")
+        await run_in_threadpool(
+            store_predictions,
+            [keys[model_names.index(name)] for name in missing],
+            predictions,
+        )
+
+    if model_type != "ensemble":
+        return results[model_type]
+    weights = [ENSEMBLE_WEIGHTS.get(name, 1.0) for name in model_names]
+    ensemble = aggregate_predictions(
+        [results[name] for name in model_names], weights=weights
+    )
+    ensemble["models"] = {
+        name: {
+            "top_prediction": results[name]["top_prediction"],
+            "weight": weight,
+            "latency_ms": round(latencies[name], 2),
+            "cached": name not in missing,
+        }
+        for name, weight in zip(model_names, weights)
+    }
+    return ensemble
+
 @router.post("/")
 async def diagnose(
+    response: Response,
     file: UploadFile = File(...),
-    model_type: str = Query("densenet", enum=["densenet", "resnet"], description="Choose which model to use: densenet or resnet.")
+    model_type: str = Query(
+        "densenet",
+        enum=["densenet", "resnet", "ensemble"],
+        description=(
+            "Choose which model to use: densenet, resnet, or ensemble to combine both."
+        ),
+    ),
 ):
-    try:
+    model_names_for(model_type)
+    timer = StageTimer()
+    with timer.stage("read"):
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid image file")
-    if model_type == "densenet":
-        model = DEFAULT_MODEL
-        if model is None:
-            raise HTTPException(status_code=500, detail="DenseNet model not available.")
-    else:
-        model = DEFAULT_RESNET_MODEL
-        if model is None:
-            raise HTTPException(status_code=500, detail="ResNet model not available.")
-    result = predict(image, model=model)
-    return result 
\ No newline at end of file
+    try:
+        result = await diagnose_contents(contents, model_type, timer)
+    except InferenceQueueFull as e:
+        raise service_busy() from e
+    apply_server_timing(response, timer)
+    return result
+
+@job_handler(DIAGNOSIS_JOB)
+async def run_diagnosis_job(payload: dict) -> dict:
+    contents = await file_storage.read_bytes(input_key(payload["token"]))
+    if contents is None:
+        raise PermanentJobError(
+            "Diagnosis image is missing from storage",
+            result={
+                "status_code": 500,
+                "detail": "Diagnosis image is missing, please submit it again.",
+            },
+        )
+    try:
+        return await diagnose_contents(
+            contents,
+            payload["model_type"],
+            StageTimer(),
+            slot_timeout=SLOT_WAIT_SECONDS,
+        )
+    except InferenceQueueFull as e:
+        REJECTED.inc()
+        raise PermanentJobError(
+            f"No inference slot within {SLOT_WAIT_SECONDS:g}s",
+            result={
+                "status_code": 503,
+                "detail": "Diagnosis service is busy, please try again shortly.",
+            },
+        ) from e
+    except HTTPException as e:
+        raise PermanentJobError(
+            str(e.detail), result={"status_code": e.status_code, "detail": e.detail}
+        ) from e
+
+@router.post("/jobs", status_code=202)
+async def create_diagnosis_job(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    model_type: str = Query(
+        "densenet",
+        enum=["densenet", "resnet", "ensemble"],
+        description=(
+            "Choose which model to use: densenet, resnet, or ensemble to combine both."
+        ),
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Queue a diagnosis and return its job id at once; poll GET /diagnosis/jobs/{id}
+    (the Location header) for the result.
+    """
+    model_names_for(model_type)
+    contents = await file.read()
+    try:
+        job = await diagnosis_jobs.submit(db, contents, model_type)
+    except JobQueueFull as e:
+        raise service_busy() from e
+    body = job_body(job)
+    response.headers["Location"] = request.url_for(
+        "get_diagnosis_job", job_id=body["id"]
+    )
+    return body
+
+@router.get("/jobs/{job_id}")
+async def get_diagnosis_job(
+    job_id: str,
+    response: Response,
+    wait: float = Query(
+        0,
+        ge=0,
+        description=(
+            f"Seconds to wait for the job to finish (long poll), "
+            f"at most {MAX_WAIT_SECONDS:g}"
+        ),
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    """Status of a diagnosis job, with its result or error once finished."""
+    job = await diagnosis_jobs.get(db, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404, detail="Diagnosis job not found or expired"
+        )
+    job = await diagnosis_jobs.wait(db, job, min(wait, MAX_WAIT_SECONDS))
+    if job.status not in FINISHED:
+        response.headers["Retry-After"] = "1"
+    return job_body(job)
+
+@router.post("/batch")
+async def diagnose_batch(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    model_type: str = Query(
+        "densenet",
+        enum=["densenet", "resnet", "both"],
+        description="Model to use for every image, or both.",
+    ),
+):
+    """
+    Diagnose several photos (e.g. of the same lesion) in one request.
+    Images are run through each model as one batch; the response has a result
+    per image and model plus a consensus across all of them.
+    """
+    # A request needs a slot per image, so one larger than the queue could never
+    # be admitted
+    max_files = min(MAX_BATCH_FILES, inference_executor.max_queue_depth)
+    if len(files) > max_files:
+        raise HTTPException(
+            status_code=400, detail=f"At most {max_files} images per request"
+        )
+    model_names = model_registry.names() if model_type == "both" else [model_type]
+    for model_name in model_names:
+        require_model(model_name)
+
+    timer = StageTimer()
+    with timer.stage("read"):
+        uploads = [await file.read() for file in files]
+    with timer.stage("hash"):
+        digests = await run_in_threadpool(
+            lambda: [content_digest(contents) for contents in uploads]
+        )
+    results = [{"filename": file.filename, "models": {}} for file in files]
+    try:
+        async with inference_executor.reserve(slots=len(files)):
+            images = None
+            for model_name in model_names:
+                version = model_registry.spec(model_name).version
+                keys = [
+                    prediction_cache.key(digest, model_name, version)
+                    for digest in digests
+                ]
+                with timer.stage("cache"):
+                    cached = await run_in_threadpool(cached_predictions, keys)
+                pending = [
+                    index for index, result in enumerate(cached) if result is None
+                ]
+                for index, result in enumerate(cached):
+                    if result is not None:
+                        results[index]["models"][model_name] = result
+                        PREDICTIONS.inc(model=model_name, source="cache")
+                if not pending:
+                    continue
+                if images is None:
+                    # Decoded once and shared between models
+                    try:
+                        with timer.stage("decode"):
+                            images = await inference_executor.run(
+                                decode_images, uploads
+                            )
+                    except ValueError as e:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Invalid image file: {files[e.args[0]].filename}",
+                        ) from e
+                timings: Dict[str, float] = {}
+                predictions = await inference_executor.run(
+                    predict_with_model,
+                    model_name,
+                    [images[index] for index in pending],
+                    timings,
+                )
+                for stage, seconds in timings.items():
+                    timer.add(f"{model_name}-{stage}", seconds)
+                for index, prediction in zip(pending, predictions):
+                    results[index]["models"][model_name] = prediction
+                    PREDICTIONS.inc(model=model_name, source="model")
+                await run_in_threadpool(
+                    store_predictions, [keys[index] for index in pending], predictions
+                )
+    except InferenceQueueFull as e:
+        raise service_busy() from e
+    except ModelNotAvailable as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    apply_server_timing(response, timer)
+    return {
+        "results": results,
+        "consensus": aggregate_predictions(
+            [
+                prediction
+                for result in results
+                for prediction in result["models"].values()
+            ]
+        ),
+    }
+
+@router.get("/models")
+async def list_models(current_user: Principal = Depends(require_admin)):
+    """Models this worker can serve and the ones loaded in memory (admins only)."""
+    return {
+        "available": [
+            name for name in model_registry.names() if model_registry.is_available(name)
+        ],
+        "resident": model_registry.resident(),
+        "memory_budget_mb": model_registry.memory_budget_bytes / (1024 * 1024) or None,
+    }
+
+@router.get("/cache")
+async def cache_stats(current_user: Principal = Depends(require_admin)):
+    """Hit/miss counters and sizes of the prediction cache tiers (admins only)."""
+    return prediction_cache.stats()
@@ -2,10 +2,18 @@ import numpy as np
 from PIL import Image
 import torch
 import torchvision.models as models
-from typing import Callable, List, Optional
+from typing import Callable, Dict, List, Optional
+import time
 import os
 from enum import Enum
 import torchvision.transforms as T
+from diagnosis.preprocessing import (
+    NORMALIZE_MEAN,
+    NORMALIZE_STD,
+    preprocess_image,
+    to_batch_tensor,
+)
+
 
 class DiagnosisClass(Enum):
     bkl = "Benign keratosis-like lesions"
@@ -20,71 +28,138 @@ class DiagnosisClass(Enum):
 DEFAULT_CLASS_NAMES = [e.name for e in DiagnosisClass]
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "model", "densenet_pret.pth")
 RESNET_MODEL_PATH = os.path.join(os.path.dirname(__file__), "model", "resnet_pret.pth")
-DEFAULT_MODEL = None
-DEFAULT_RESNET_MODEL = None
-if os.path.exists(MODEL_PATH):
-    DEFAULT_MODEL = models.densenet121(pretrained=False)
-    DEFAULT_MODEL.classifier = torch.nn.Linear(DEFAULT_MODEL.classifier.in_features, len(DEFAULT_CLASS_NAMES))
-    DEFAULT_MODEL.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
-    DEFAULT_MODEL = DEFAULT_MODEL.float()
-    DEFAULT_MODEL.eval()
-if os.path.exists(RESNET_MODEL_PATH):
-    DEFAULT_RESNET_MODEL = models.resnet50(pretrained=False)
-    DEFAULT_RESNET_MODEL.fc = torch.nn.Linear(DEFAULT_RESNET_MODEL.fc.in_features, len(DEFAULT_CLASS_NAMES))
-    DEFAULT_RESNET_MODEL.load_state_dict(torch.load(RESNET_MODEL_PATH, map_location="cpu"))
-    DEFAULT_RESNET_MODEL = DEFAULT_RESNET_MODEL.float()
-    DEFAULT_RESNET_MODEL.eval()
-
 val_test_transform = T.Compose([
     T.Resize((224, 224)),
     T.ToTensor(),
-    T.Normalize([0.77148203, 0.55764165, 0.58345652], [0.12655577, 0.14245141, 0.15189891])
+    T.Normalize(NORMALIZE_MEAN.tolist(), NORMALIZE_STD.tolist())
 ])
 
 def default_preprocess(image: Image.Image) -> np.ndarray:
-    tensor = val_test_transform(image.convert('RGB'))
-    return tensor.unsqueeze(0).numpy()  # Add batch dimension and convert to numpy
+    # Approximates val_test_transform without the tensor -> numpy round trip.
+    # decode_image's draft decoding and reducing_gap resize give slightly
+    # different pixels for large photos, hence PREPROCESS_VERSION.
+    return preprocess_image(image)
 
 DEFAULT_PREPROCESS = default_preprocess
 
-def load_model(model_path: str, num_classes: int):
+def build_densenet(num_classes: int) -> torch.nn.Module:
     model = models.densenet121(pretrained=False)
     model.classifier = torch.nn.Linear(model.classifier.in_features, num_classes)
+    return model
+
+def build_resnet(num_classes: int) -> torch.nn.Module:
+    model = models.resnet50(pretrained=False)
+    model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+def load_model(
+    model_path: str,
+    num_classes: int,
+    builder: Callable[[int], torch.nn.Module] = build_densenet
+):
+    model = builder(num_classes)
     model.load_state_dict(torch.load(model_path, map_location="cpu"))
     model = model.float()
     model.eval()
     return model
 
 
-def predict(
-    image: Image.Image,
-    model=DEFAULT_MODEL,
+def _format_prediction(probabilities: np.ndarray, class_names: List[str]) -> dict:
+    predictions = [
+        {
+            "class": DiagnosisClass[cls].value,
+            "short_name": cls,
+            "confidence": float(prob)
+        }
+        for cls, prob in zip(class_names, probabilities)
+    ]
+    top_idx = int(np.argmax(probabilities))
+    top_prediction = predictions[top_idx]
+    return {
+        "predictions": predictions,
+        "top_prediction": top_prediction
+    }
+
+
+def predict_batch(
+    images: List[Image.Image],
+    model=None,
     preprocess: Callable[[Image.Image], np.ndarray] = DEFAULT_PREPROCESS,
-    class_names: Optional[List[str]] = None
-) -> dict:
+    class_names: Optional[List[str]] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> List[dict]:
     """
-    Preprocess the image, use the provided model, and return the prediction result.
+    Run a single forward pass over several images and return one prediction
+    result per image, in the same order. If timings is given, the seconds
+    spent in preprocess, forward and postprocess are added to it.
     """
     if model is None:
-        raise ValueError("Model is not loaded. Please check the model path or load the model explicitly.")
+        raise ValueError(
+            "Model is not loaded. "
+            "Please check the model path or load the model explicitly."
+        )
     if class_names is None:
         class_names = DEFAULT_CLASS_NAMES
-    processed_image = preprocess(image)
+    start = time.perf_counter()
+    if preprocess is DEFAULT_PREPROCESS:
+        input_tensor = to_batch_tensor(images)
+    else:
+        input_tensor = torch.from_numpy(
+            np.concatenate([preprocess(image) for image in images], axis=0)
+        ).float()
+    preprocessed = time.perf_counter()
     with torch.no_grad():
-        input_tensor = torch.from_numpy(processed_image).float()
         output = model(input_tensor)
-        probabilities = torch.softmax(output, dim=1).cpu().numpy()[0]
-        predictions = [
-            {
-                "class": DiagnosisClass[cls].value,
-                "short_name": cls,
-                "confidence": float(prob)
-            }
-            for cls, prob in zip(class_names, probabilities)
-        ]
-        top_idx = int(np.argmax(probabilities))
-        top_prediction = predictions[top_idx]
-        return {
-            "predictions": predictions,
-            "top_prediction": top_prediction
-        } 
\ No newline at end of file
+        probabilities = torch.softmax(output, dim=1).cpu().numpy()
+    forwarded = time.perf_counter()
+    results = [_format_prediction(row, class_names) for row in probabilities]
+    if timings is not None:
+        finished = time.perf_counter()
+        for stage, seconds in (
+            ("preprocess", preprocessed - start),
+            ("forward", forwarded - preprocessed),
+            ("postprocess", finished - forwarded),
+        ):
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    return results
+
+
+def aggregate_predictions(
+    results: List[dict], weights: Optional[List[float]] = None
+) -> dict:
+    """
+    Consensus over several prediction results (e.g. multiple photos of one
+    lesion, or several models on one photo): per-class confidences are
+    averaged, optionally weighted, and "agreement" is the share of results
+    whose top prediction matches the consensus.
+    """
+    class_names = [prediction["short_name"] for prediction in results[0]["predictions"]]
+    confidences = np.average(
+        [
+            [prediction["confidence"] for prediction in result["predictions"]]
+            for result in results
+        ],
+        axis=0,
+        weights=weights,
+    )
+    consensus = _format_prediction(confidences, class_names)
+    top_class = consensus["top_prediction"]["short_name"]
+    matching = sum(
+        result["top_prediction"]["short_name"] == top_class for result in results
+    )
+    consensus["agreement"] = matching / len(results)
+    return consensus
+
+
+def predict(
+    image: Image.Image,
+    model=None,
+    preprocess: Callable[[Image.Image], np.ndarray] = DEFAULT_PREPROCESS,
+    class_names: Optional[List[str]] = None
+) -> dict:
+    """
+    Preprocess the image, use the provided model, and return the prediction result.
+    """
+    return predict_batch(
+        [image], model=model, preprocess=preprocess, class_names=class_names
+    )[0]
@@ -0,0 +1 @@
+# This file makes the jobs directory a Python package
@@ -0,0 +1,28 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from jobs import models
+from pagination import paginate
+
+
+async def get_job(db: AsyncSession, job_id: int):
+    result = await db.execute(select(models.Job).where(models.Job.id == job_id))
+    return result.scalars().first()
+
+async def get_jobs(
+    db: AsyncSession,
+    status: Optional[models.JobStatus] = None,
+    kind: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None
+):
+    query = select(models.Job)
+    if status is not None:
+        query = query.where(models.Job.status == status)
+    if kind is not None:
+        query = query.where(models.Job.kind == kind)
+    result = await db.execute(paginate(query, models.Job.id, skip, limit, after_id))
+    return result.scalars().all()
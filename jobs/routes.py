@@ -0,0 +1,64 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.principal import Principal
+from database import get_db
+from dependencies import require_admin
+from jobs import models, queries, schemas, transactions
+from jobs.worker import job_worker
+from pagination import decode_cursor, set_next_page_headers, split_page
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.get("/", response_model=list[schemas.JobOut])
+async def list_jobs(
+    request: Request,
+    response: Response,
+    status: Optional[models.JobStatus] = None,
+    kind: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = Query(
+        None, description="X-Next-Cursor from the previous page; replaces skip"
+    ),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(require_admin),
+):
+    jobs = await queries.get_jobs(
+        db,
+        status=status,
+        kind=kind,
+        skip=skip,
+        limit=limit + 1,
+        after_id=decode_cursor(cursor),
+    )
+    page, next_cursor = split_page(jobs, limit)
+    set_next_page_headers(request, response, next_cursor)
+    return page
+
+@router.get("/{job_id}", response_model=schemas.JobOut)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(require_admin),
+):
+    job = await queries.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/retry", response_model=schemas.JobOut)
+async def retry_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(require_admin),
+):
+    job, error = await transactions.retry_job_transaction(db, job_id)
+    if error:
+        raise HTTPException(
+            status_code=404 if error == "Job not found" else 400, detail=error
+        )
+    job_worker.wake()
+    return job
@@ -0,0 +1,29 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, validator
+
+from jobs.models import JobStatus
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    last_error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @validator("payload", "result", pre=True)
+    def parse_json(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+
+    class Config:
+        orm_mode = True
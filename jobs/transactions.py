@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from jobs import models
+from jobs.queries import get_job
+
+
+async def retry_job_transaction(db: AsyncSession, job_id: int):
+    job = await get_job(db, job_id)
+    if not job:
+        return None, "Job not found"
+    if job.status != models.JobStatus.FAILED:
+        return None, "Only failed jobs can be retried"
+    job.status = models.JobStatus.PENDING
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    job.result = None
+    await db.commit()
+    await db.refresh(job)
+    return job, None
@@ -0,0 +1,277 @@
+"""
+Background jobs that outlive the request that created them.
+
+A job is a row in the jobs table, so it is committed together with the work
+that queued it and survives restarts. An in-process worker picks up due
+jobs, runs the handler registered for their kind and records the outcome.
+A handler that raises is retried with exponential backoff until its
+max_attempts are used up; raising PermanentJobError fails it at once.
+Whatever the handler returns is stored as the job's result.
+
+A worker created with kinds= takes only jobs of those kinds, which the
+other workers then leave alone, so slow or latency-sensitive work can have
+its own pool.
+
+Jobs still marked running at startup were interrupted by a restart and are
+queued again, so handlers must be safe to run more than once. Claiming a
+job is a conditional UPDATE, so several app processes may share the table
+(a process restarting may then requeue a job another one is still running,
+which the same rule makes harmless).
+"""
+import asyncio
+import json
+import os
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from sqlalchemy import select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from jobs.models import Job, JobStatus
+from metrics import counter
+
+# Jobs run at the same time by this process
+JOB_WORKERS = int(os.environ.get("DR_SKIN_JOB_WORKERS", "1"))
+# How often to look for jobs queued by other processes or due for a retry
+JOB_POLL_SECONDS = float(os.environ.get("DR_SKIN_JOB_POLL_SECONDS", "5"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("DR_SKIN_JOB_MAX_ATTEMPTS", "3"))
+# Retry n waits JOB_RETRY_BASE_SECONDS * 2 ** (n - 1)
+JOB_RETRY_BASE_SECONDS = float(os.environ.get("DR_SKIN_JOB_RETRY_BASE_SECONDS", "10"))
+# How long shutdown waits for running jobs before cancelling them
+JOB_SHUTDOWN_SECONDS = float(os.environ.get("DR_SKIN_JOB_SHUTDOWN_SECONDS", "10"))
+
+JOBS_FINISHED = counter(
+    "dr_skin_jobs_finished_total",
+    "Background job attempts by kind and outcome.",
+    ("kind", "outcome"),
+)
+
+class PermanentJobError(Exception):
+    """
+    Raised by a handler for failures that retrying can't fix; result, if given,
+    is stored on the job.
+    """
+
+    def __init__(self, message: str, result: Optional[dict] = None):
+        super().__init__(message)
+        self.result = result
+
+JobHandler = Callable[[dict], Awaitable[Optional[dict]]]
+
+handlers: Dict[str, JobHandler] = {}
+# Kinds run by a worker of their own
+dedicated_kinds: Set[str] = set()
+
+def job_handler(kind: str):
+    """
+    Register the coroutine function that runs jobs of this kind; it gets the
+    job's payload and may return a JSON-serializable result.
+    """
+    def register(handler: JobHandler) -> JobHandler:
+        handlers[kind] = handler
+        return handler
+    return register
+
+async def enqueue(
+    db: AsyncSession, kind: str, payload: dict, max_attempts: Optional[int] = None
+) -> Job:
+    """
+    Queue a job in the caller's transaction (flush, no commit); call
+    job_worker.wake() after committing.
+    """
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status=JobStatus.PENDING,
+        attempts=0,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    await db.flush()
+    return job
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+class JobWorker:
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        kinds: Optional[Iterable[str]] = None,
+    ):
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.kinds = tuple(kinds or ())
+        dedicated_kinds.update(self.kinds)
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self):
+        await self.requeue_interrupted()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._run()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        """
+        Stop taking jobs; one still running after JOB_SHUTDOWN_SECONDS is cut short
+        and requeued on the next start.
+        """
+        # Workers stop between jobs rather than being cancelled mid-query,
+        # which could leave a database connection checked out past close_db()
+        self._stopping = True
+        self.wake()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=JOB_SHUTDOWN_SECONDS)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        """Start on newly committed jobs now rather than at the next poll."""
+        if self._wakeup is not None:
+            self.ensure_running()
+            self._wakeup.set()
+
+    def ensure_running(self):
+        """Replace worker tasks that have died; the others carry on with their jobs."""
+        if self._stopping:
+            return
+        for index, task in enumerate(self._tasks):
+            if task.done():
+                if not task.cancelled() and task.exception() is not None:
+                    print(
+                        "[DrSkin] Job worker stopped unexpectedly, restarting: "
+                        f"{task.exception()}"
+                    )
+                self._tasks[index] = asyncio.ensure_future(self._run())
+
+    def kind_filter(self):
+        """Jobs this worker takes: its own kinds, or those no dedicated worker runs."""
+        if self.kinds:
+            return Job.kind.in_(self.kinds)
+        if dedicated_kinds:
+            return Job.kind.notin_(dedicated_kinds)
+        return true()
+
+    async def requeue_interrupted(self):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Job)
+                .where(Job.status == JobStatus.RUNNING, self.kind_filter())
+                .values(status=JobStatus.PENDING)
+            )
+            await db.commit()
+        if result.rowcount:
+            print(f"[DrSkin] Requeued {result.rowcount} interrupted background job(s)")
+
+    async def claim(self) -> Optional[Job]:
+        """Mark the next due job running and return it, or None if nothing is due."""
+        async with AsyncSessionLocal() as db:
+            while True:
+                now = datetime.utcnow()
+                result = await db.execute(
+                    select(Job.id)
+                    .where(
+                        Job.status == JobStatus.PENDING,
+                        Job.run_after <= now,
+                        self.kind_filter(),
+                    )
+                    .order_by(Job.run_after, Job.id)
+                    .limit(1)
+                )
+                job_id = result.scalar()
+                if job_id is None:
+                    return None
+                claimed = await db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == JobStatus.PENDING)
+                    .values(
+                        status=JobStatus.RUNNING,
+                        attempts=Job.attempts + 1,
+                        started_at=now,
+                    )
+                )
+                await db.commit()
+                if claimed.rowcount:
+                    return await db.get(Job, job_id)
+                # Another worker got there first
+
+    async def finish(
+        self,
+        job: Job,
+        error: Optional[BaseException] = None,
+        result: Optional[dict] = None,
+    ) -> JobStatus:
+        """Record the attempt's outcome and return the job's new status."""
+        values = {"finished_at": datetime.utcnow()}
+        if error is None:
+            values.update(status=JobStatus.SUCCEEDED, last_error=None)
+            outcome = "succeeded"
+        else:
+            values["last_error"] = "".join(
+                traceback.format_exception_only(type(error), error)
+            ).strip()
+            if isinstance(error, PermanentJobError) or job.attempts >= job.max_attempts:
+                values["status"] = JobStatus.FAILED
+                outcome = "failed"
+                result = getattr(error, "result", None)
+                print(
+                    f"[DrSkin] Job {job.id} ({job.kind}) failed: {values['last_error']}"
+                )
+            else:
+                values.update(
+                    status=JobStatus.PENDING,
+                    run_after=datetime.utcnow() + retry_delay(job.attempts),
+                )
+                outcome = "retried"
+        values["result"] = json.dumps(result) if result is not None else None
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Job).where(Job.id == job.id).values(**values))
+            await db.commit()
+        JOBS_FINISHED.inc(kind=job.kind, outcome=outcome)
+        return values["status"]
+
+    async def run_job(self, job: Job):
+        handler = handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise PermanentJobError(
+                    f"No handler registered for job kind {job.kind!r}"
+                )
+            result = await handler(json.loads(job.payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await self.finish(job, exc)
+        else:
+            await self.finish(job, result=result)
+
+    async def _run(self):
+        while not self._stopping:
+            # Cleared before looking, so a wake() during the lookup isn't lost
+            self._wakeup.clear()
+            try:
+                job = await self.claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                print(f"[DrSkin] Job worker could not claim a job: {exc}")
+                job = None
+            if job is not None:
+                await self.run_job(job)
+                continue
+            if self._stopping:
+                break
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+job_worker = JobWorker()
@@ -1,17 +1,26 @@
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from specialists import routes as specialist_routes
-from database import init_db, get_db
+from specialists.search import init_search_index
+from database import init_db, close_db, engine, AsyncSessionLocal
 from auth import routes as auth_routes
 from dashboard import routes as dashboard_routes
+from jobs import routes as job_routes
+from jobs.worker import job_worker
 from sqlalchemy.exc import SQLAlchemyError
 import traceback
 from diagnosis import routes as diagnosis_routes
+from diagnosis import batching as diagnosis_batching
+from diagnosis.jobs import diagnosis_jobs
+from diagnosis.executor import inference_executor
+from diagnosis.registry import model_registry, WARM_MODELS
 import os
-from sqlalchemy.orm import Session
+import metrics
+from pagination import NEXT_CURSOR_HEADER
 from auth.models import UserType, UserStatus
-from auth.security import get_password_hash
+from auth.security import get_password_hash_async
 from auth.queries import get_user_by_username
 
 app = FastAPI(
@@ -27,23 +36,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    # Pagination headers readable by browser clients
+    expose_headers=[NEXT_CURSOR_HEADER, "Link"],
 )
 
 @app.middleware("http")
 async def db_session_middleware(request: Request, call_next):
-    """Middleware to store database session in request state"""
-    # Create a database session
-    for db in get_db():
-        request.state.db = db
-        try:
-            response = await call_next(request)
-            return response
-        except Exception:
-            # Rollback on any exception
-            db.rollback()
-            raise
-        finally:
-            db.close()
+    """Middleware to clean up the request's database session, if a route opened one"""
+    # The session itself is created lazily by database.get_db and stored in
+    # request.state
+    try:
+        response = await call_next(request)
+        return response
+    except Exception:
+        # Rollback on any exception
+        db = getattr(request.state, "db", None)
+        if db is not None:
+            await db.rollback()
+        raise
+    finally:
+        db = getattr(request.state, "db", None)
+        if db is not None:
+            await db.close()
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -53,7 +67,7 @@ async def global_exception_handler(request: Request, exc: Exception):
     
     if db:
         try:
-            db.rollback()
+            await db.rollback()
         except Exception as rollback_error:
             print(f"Error during rollback: {rollback_error}")
     
@@ -75,7 +89,7 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
     
     if db:
         try:
-            db.rollback()
+            await db.rollback()
         except Exception as rollback_error:
             print(f"Error during rollback: {rollback_error}")
     
@@ -94,39 +108,63 @@ DEFAULT_ADMIN_EMAIL = "admin@drskin.dev"
 DEFAULT_ADMIN_PASSWORD = "admin123"
 
 @app.on_event("startup")
-def on_startup():
-    init_db()
+async def warm_up_models():
+    if WARM_MODELS:
+        loaded = await inference_executor.run(model_registry.warm_up, WARM_MODELS)
+        print(f"[DrSkin] Models loaded at startup: {', '.join(loaded) or 'none'}")
+
+@app.on_event("startup")
+async def on_startup():
+    await init_db()
+    await init_search_index(engine)
     env = os.environ.get("DR_SKIN_ENV", "dev")
     if env == "dev":
         # Create default admin if not exists
-        db: Session = next(get_db())
-        admin_user = get_user_by_username(db, DEFAULT_ADMIN_USERNAME)
-        if not admin_user:
-            hashed_password = get_password_hash(DEFAULT_ADMIN_PASSWORD)
-            from auth import models
-            db_user = models.User(
-                username=DEFAULT_ADMIN_USERNAME,
-                email=DEFAULT_ADMIN_EMAIL,
-                hashed_password=hashed_password,
-                user_type=UserType.ADMIN,
-                status=UserStatus.ACTIVE,
-                is_active=True,
-                is_superuser=True
-            )
-            db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
-            print("\n[DrSkin] Default admin created:")
-            print(f"  Username: {DEFAULT_ADMIN_USERNAME}")
-            print(f"  Email: {DEFAULT_ADMIN_EMAIL}")
-            print(f"  Password: {DEFAULT_ADMIN_PASSWORD}\n")
-        else:
-            print("[DrSkin] Default admin already exists.")
+        async with AsyncSessionLocal() as db:
+            admin_user = await get_user_by_username(db, DEFAULT_ADMIN_USERNAME)
+            if not admin_user:
+                hashed_password = await get_password_hash_async(DEFAULT_ADMIN_PASSWORD)
+                from auth import models
+                db_user = models.User(
+                    username=DEFAULT_ADMIN_USERNAME,
+                    email=DEFAULT_ADMIN_EMAIL,
+                    hashed_password=hashed_password,
+                    user_type=UserType.ADMIN,
+                    status=UserStatus.ACTIVE,
+                    is_active=True,
+                    is_superuser=True
+                )
+                db.add(db_user)
+                await db.commit()
+                print("\n[DrSkin] Default admin created:")
+                print(f"  Username: {DEFAULT_ADMIN_USERNAME}")
+                print(f"  Email: {DEFAULT_ADMIN_EMAIL}")
+                print(f"  Password: {DEFAULT_ADMIN_PASSWORD}\n")
+            else:
+                print("[DrSkin] Default admin already exists.")
+    await job_worker.start()
+    await diagnosis_jobs.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_worker.shutdown()
+    await diagnosis_jobs.shutdown()
+    await diagnosis_batching.shutdown()
+    inference_executor.shutdown()
+    await close_db()
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to Dr. Skin API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(
+        await run_in_threadpool(metrics.REGISTRY.render),
+        media_type="text/plain; version=0.0.4",
+    )
+
 @app.post("/diagnose")
 async def pseudo_diagnose():
     """Pseudo endpoint for skin disease diagnosis (static data)."""
@@ -143,4 +181,5 @@ async def pseudo_diagnose():
 app.include_router(specialist_routes.router)
 app.include_router(auth_routes.router)
 app.include_router(dashboard_routes.router)
+app.include_router(job_routes.router)
 app.include_router(diagnosis_routes.router) 
\ No newline at end of file
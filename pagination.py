@@ -0,0 +1,59 @@
+"""
+Keyset (cursor) pagination helpers for the listing endpoints.
+
+Listings are ordered by id. A client passes the opaque cursor from the
+previous page's X-Next-Cursor header (also sent as a Link rel="next") and
+gets the rows after that id, so deep pages cost the same as the first one
+and rows inserted meanwhile are neither skipped nor repeated.
+"""
+import base64
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(last_id: int) -> str:
+    payload = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """The id a cursor points after, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+        if not isinstance(last_id, int):
+            raise ValueError(last_id)
+        return last_id
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+def paginate(
+    query, id_column, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+):
+    """Order a select by id and apply the cursor (after_id) or the classic offset."""
+    query = query.order_by(id_column)
+    if after_id is not None:
+        return query.where(id_column > after_id).limit(limit)
+    return query.offset(skip).limit(limit)
+
+def split_page(rows: List, limit: int) -> Tuple[List, Optional[str]]:
+    """Trim a result fetched with limit + 1 rows to the page and the next cursor."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].id)
+    return rows, None
+
+def set_next_page_headers(
+    request: Request, response: Response, next_cursor: Optional[str]
+):
+    if next_cursor is None:
+        return
+    response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    next_url = request.url.remove_query_params("skip").include_query_params(
+        cursor=next_cursor
+    )
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
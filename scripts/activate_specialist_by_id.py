@@ -1,4 +1,3 @@
-import asyncio
 import sys
 import os
 
@@ -6,7 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import AsyncSessionLocal
+from database import AsyncSessionLocal, run_with_db
 from auth.models import UserStatus
 from auth.queries import get_user
 from specialists.queries import get_specialist_by_user_id
@@ -61,4 +60,4 @@ if __name__ == "__main__":
         print("Error: user_id must be an integer")
         sys.exit(1)
     
-    asyncio.run(activate_specialist_by_id(user_id)) 
\ No newline at end of file
+    run_with_db(activate_specialist_by_id(user_id)) 
\ No newline at end of file
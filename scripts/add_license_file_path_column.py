@@ -1,4 +1,3 @@
-import asyncio
 import sys
 import os
 
@@ -6,7 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import AsyncSessionLocal
+from database import AsyncSessionLocal, run_with_db
 from sqlalchemy import text
 
 async def add_license_file_path_column():
@@ -35,4 +34,4 @@ async def add_license_file_path_column():
             await db.rollback()
 
 if __name__ == "__main__":
-    asyncio.run(add_license_file_path_column()) 
\ No newline at end of file
+    run_with_db(add_license_file_path_column()) 
\ No newline at end of file
@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from PIL import Image
+
+from diagnosis import batching, executor
+from diagnosis.preprocessing import decode_image
+from diagnosis.registry import model_registry
+
+FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+
+def synthetic_image(width: int, height: int, seed: int) -> Image.Image:
+    """Smooth colour gradients plus noise, so it compresses roughly like a photo."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = [
+        128 + 100 * np.sin(x / (width / rng.uniform(1, 6)) + rng.uniform(0, 6))
+        * np.cos(y / (height / rng.uniform(1, 6)))
+        for _ in range(3)
+    ]
+    array = np.stack(channels, axis=-1) + rng.normal(0, 12, (height, width, 3))
+    return Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "png":
+        image.save(buffer, "PNG")
+    else:
+        image.save(buffer, FORMATS[fmt], quality=90)
+    return buffer.getvalue()
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    values = np.asarray(samples_ms)
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def use_random_weights(model_names, directory: str):
+    """Point models without weights at randomly initialized ones."""
+    substituted = []
+    for name in model_names:
+        spec = model_registry.spec(name)
+        if os.path.exists(spec.path):
+            continue
+        path = os.path.join(directory, f"{name}_random.pth")
+        torch.save(spec.builder(spec.num_classes).state_dict(), path)
+        spec.path = path
+        substituted.append(name)
+    return substituted
+
+
+def bench_single_image(model_name, resolutions, formats, iterations):
+    results = []
+    # Load and warm up
+    batching.predict_with_model(model_name, [synthetic_image(224, 224, 0)])
+    for width, height in resolutions:
+        image = synthetic_image(width, height, width * height)
+        for fmt in formats:
+            payload = encode(image, fmt)
+            decode_ms, total_ms = [], []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                decoded = decode_image(payload)
+                decoded_at = time.perf_counter()
+                batching.predict_with_model(model_name, [decoded])
+                end = time.perf_counter()
+                decode_ms.append((decoded_at - start) * 1000)
+                total_ms.append((end - start) * 1000)
+            results.append({
+                "resolution": f"{width}x{height}",
+                "format": fmt,
+                "bytes": len(payload),
+                "decode": percentiles(decode_ms),
+                "total": percentiles(total_ms),
+            })
+            print(
+                f"  single {model_name:<8} {width}x{height:<5} {fmt:<4} "
+                f"decode p50 {results[-1]['decode']['p50_ms']:7.1f} ms  "
+                f"total p50 {results[-1]['total']['p50_ms']:7.1f} ms"
+            )
+    return results
+
+
+def bench_batched(model_name, batch_sizes, iterations):
+    results = []
+    images = [synthetic_image(224, 224, seed) for seed in range(max(batch_sizes))]
+    for batch_size in batch_sizes:
+        batch = images[:batch_size]
+        batching.predict_with_model(model_name, batch)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            batching.predict_with_model(model_name, batch)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "batch_size": batch_size,
+            "images_per_second": batch_size * iterations / elapsed,
+            "ms_per_batch": elapsed * 1000 / iterations,
+        })
+        print(
+            f"  batch  {model_name:<8} size {batch_size:<3} "
+            f"{results[-1]['images_per_second']:8.1f} img/s  "
+            f"{results[-1]['ms_per_batch']:8.1f} ms/batch"
+        )
+    return results
+
+
+def multipart_body(payload: bytes, filename: str):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+async def asgi_post(app, path: str, query: str, body: bytes, content_type: str) -> int:
+    """Send one request straight into the ASGI app, without a server or socket."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [
+            (b"host", b"benchmark"),
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    response_complete = asyncio.Event()
+    status = {}
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message["type"] == "http.response.body" and not message.get(
+            "more_body", False
+        ):
+            response_complete.set()
+
+    await app(scope, receive, send)
+    return status.get("code", 0)
+
+
+async def run_load(app, model_name, payloads, concurrency=None, rate=None):
+    """Closed loop with a fixed number of clients, or open loop at a fixed rate."""
+    latencies, statuses = [], {}
+    requests = [
+        multipart_body(payload, f"bench_{i}.jpg") for i, payload in enumerate(payloads)
+    ]
+
+    async def one(body, content_type):
+        start = time.perf_counter()
+        code = await asgi_post(
+            app, "/diagnosis/", f"model_type={model_name}", body, content_type
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[code] = statuses.get(code, 0) + 1
+
+    start = time.perf_counter()
+    try:
+        await _drive(requests, one, concurrency, rate)
+        elapsed = time.perf_counter() - start
+    finally:
+        await batching.shutdown()
+    return {
+        "requests": len(payloads),
+        "throughput_rps": len(payloads) / elapsed,
+        "statuses": {str(code): count for code, count in statuses.items()},
+        "latency": percentiles(latencies),
+    }
+
+
+async def _drive(requests, one, concurrency, rate):
+    if rate:
+        rng = np.random.default_rng(0)
+        tasks = []
+        for body, content_type in requests:
+            tasks.append(asyncio.ensure_future(one(body, content_type)))
+            await asyncio.sleep(rng.exponential(1.0 / rate))
+        await asyncio.gather(*tasks)
+    else:
+        queue = list(requests)
+
+        async def client():
+            while queue:
+                await one(*queue.pop())
+
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+
+
+def bench_concurrent(model_name, concurrency_levels, rates, requests, resolution):
+    import main
+
+    width, height = resolution
+    payload = encode(synthetic_image(width, height, 42), "jpeg")
+    results = []
+    profiles = [("closed", level) for level in concurrency_levels] + [
+        ("open", rate) for rate in rates
+    ]
+    for kind, value in profiles:
+        # Unique bytes per request so the prediction cache never short-circuits a run;
+        # JPEG decoders ignore anything after the end-of-image marker
+        payloads = [payload + uuid.uuid4().bytes for _ in range(requests)]
+        if kind == "closed":
+            result = asyncio.run(
+                run_load(main.app, model_name, payloads, concurrency=value)
+            )
+        else:
+            result = asyncio.run(run_load(main.app, model_name, payloads, rate=value))
+        result.update(
+            {"profile": kind, "level": value, "resolution": f"{width}x{height}"}
+        )
+        results.append(result)
+        latency = result["latency"]
+        print(
+            f"  load   {model_name:<8} {kind:<6} {value:<5} "
+            f"{result['throughput_rps']:7.1f} req/s  "
+            f"p50 {latency['p50_ms']:7.1f}  p95 {latency['p95_ms']:7.1f}  "
+            f"p99 {latency['p99_ms']:7.1f} ms  "
+            f"{result['statuses']}"
+        )
+    return results
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path}")
+    for model_name, sections in current["models"].items():
+        previous = baseline.get("models", {}).get(model_name)
+        if not previous:
+            continue
+        for old, new in zip(previous.get("batched", []), sections.get("batched", [])):
+            if old["batch_size"] == new["batch_size"]:
+                change = (new["images_per_second"] / old["images_per_second"] - 1) * 100
+                print(f"  {model_name} batch {new['batch_size']}: {change:+.1f}% img/s")
+        for old, new in zip(
+            previous.get("concurrent", []), sections.get("concurrent", [])
+        ):
+            if (old["profile"], old["level"]) == (new["profile"], new["level"]):
+                change = (new["latency"]["p95_ms"] / old["latency"]["p95_ms"] - 1) * 100
+                print(
+                    f"  {model_name} {new['profile']} {new['level']}: "
+                    f"{change:+.1f}% p95 latency"
+                )
+
+
+def parse_resolution(value: str):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the diagnosis inference path."
+    )
+    parser.add_argument("--models", nargs="+", default=model_registry.names())
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution,
+                        default=[(224, 224), (1024, 768), (4032, 3024)])
+    parser.add_argument(
+        "--formats", nargs="+", choices=sorted(FORMATS), default=["jpeg", "png"]
+    )
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8, 16])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32],
+                        help="Closed-loop client counts for the in-process load test")
+    parser.add_argument("--rates", nargs="*", type=float, default=[],
+                        help="Open-loop arrival rates (requests/sec) for the load test")
+    parser.add_argument(
+        "--requests", type=int, default=64, help="Requests per load profile"
+    )
+    parser.add_argument("--load-resolution", type=parse_resolution, default=(1024, 768))
+    parser.add_argument(
+        "--skip", nargs="*", choices=["single", "batched", "concurrent"], default=[]
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as weights_dir:
+        random_weights = use_random_weights(args.models, weights_dir)
+        if random_weights:
+            print(
+                f"Using randomly initialized weights for: {', '.join(random_weights)}"
+            )
+        report = {
+            "timestamp": time.time(),
+            "environment": {
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "cpu_count": os.cpu_count(),
+                "torch_threads": torch.get_num_threads(),
+                "inference_workers": executor.INFERENCE_WORKERS,
+                "max_batch_size": batching.MAX_BATCH_SIZE,
+                "max_batch_wait_ms": batching.MAX_BATCH_WAIT_MS,
+                "random_weights": random_weights,
+            },
+            "models": {},
+        }
+        for model_name in args.models:
+            spec = model_registry.spec(model_name)
+            print(f"{model_name} ({spec.backend} backend)")
+            section = {"backend": spec.backend}
+            if "single" not in args.skip:
+                section["single"] = bench_single_image(
+                    model_name, args.resolutions, args.formats, args.iterations
+                )
+            if "batched" not in args.skip:
+                section["batched"] = bench_batched(
+                    model_name, args.batch_sizes, args.iterations
+                )
+            if "concurrent" not in args.skip:
+                section["concurrent"] = bench_concurrent(
+                    model_name,
+                    args.concurrency,
+                    args.rates,
+                    args.requests,
+                    args.load_resolution,
+                )
+            report["models"][model_name] = section
+            model_registry.unload(model_name)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(report, args.compare)
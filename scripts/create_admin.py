@@ -1,25 +1,24 @@
-import asyncio
 import sys
 import os
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import SessionLocal
+from database import AsyncSessionLocal, run_with_db
 from auth import models, schemas
 from auth.security import get_password_hash
 from auth.queries import get_user_by_username, get_user_by_email
 
-def create_admin_user(username: str, email: str, password: str):
-    with SessionLocal() as db:
+async def create_admin_user(username: str, email: str, password: str):
+    async with AsyncSessionLocal() as db:
         # Check if username exists
-        existing_user = get_user_by_username(db, username=username)
+        existing_user = await get_user_by_username(db, username=username)
         if existing_user:
             print(f"Error: Username '{username}' already exists")
             return
         
         # Check if email exists
-        existing_email = get_user_by_email(db, email=email)
+        existing_email = await get_user_by_email(db, email=email)
         if existing_email:
             print(f"Error: Email '{email}' already exists")
             return
@@ -36,8 +35,7 @@ def create_admin_user(username: str, email: str, password: str):
             is_superuser=True
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
         print(f"Successfully created admin user: {username}")
 
 if __name__ == "__main__":
@@ -49,4 +47,4 @@ if __name__ == "__main__":
     email = sys.argv[2]
     password = sys.argv[3]
     
-    create_admin_user(username, email, password)
\ No newline at end of file
+    run_with_db(create_admin_user(username, email, password))
\ No newline at end of file
@@ -0,0 +1,150 @@
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from PIL import Image
+
+from diagnosis import backends
+from diagnosis.registry import model_registry
+from diagnosis.services import default_preprocess
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_samples(image_dir: str, count: int, batch_size: int):
+    """Batches of preprocessed images from a directory, or random ones if none given."""
+    if image_dir:
+        paths = sorted(
+            os.path.join(image_dir, name)
+            for name in os.listdir(image_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )[:count]
+        arrays = [default_preprocess(Image.open(path)) for path in paths]
+    else:
+        rng = np.random.default_rng(0)
+        arrays = [
+            default_preprocess(
+                Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8))
+            )
+            for _ in range(count)
+        ]
+    if not arrays:
+        raise SystemExit(f"No images found in {image_dir}")
+    return [
+        torch.from_numpy(np.concatenate(arrays[i:i + batch_size])).float()
+        for i in range(0, len(arrays), batch_size)
+    ]
+
+
+def run(model, batches):
+    with torch.no_grad():
+        # One untimed pass so graph optimization and allocation don't skew timings
+        model(batches[0])
+        start = time.perf_counter()
+        probabilities = [torch.softmax(model(batch), dim=1) for batch in batches]
+        elapsed = time.perf_counter() - start
+    return torch.cat(probabilities), elapsed
+
+
+def validate(name: str, backend: str, baseline_probs, baseline_time, batches):
+    spec = model_registry.spec(name)
+    candidate = backends.load_backend(backend, spec.path, spec.load_eager)
+    probs, elapsed = run(candidate, batches)
+    agreement = (
+        (probs.argmax(dim=1) == baseline_probs.argmax(dim=1)).float().mean().item()
+    )
+    max_diff = (probs - baseline_probs).abs().max().item()
+    print(
+        f"  {backend:<13} top-1 agreement {agreement * 100:6.2f}%  "
+        f"max |dp| {max_diff:.4f}  "
+        f"{elapsed * 1000 / len(baseline_probs):7.2f} ms/img "
+        f"(eager {baseline_time * 1000 / len(baseline_probs):.2f})"
+    )
+    return agreement
+
+
+def export_model(
+    name: str, targets, calibration, validation, min_agreement: float
+) -> bool:
+    spec = model_registry.spec(name)
+    if not os.path.exists(spec.path):
+        print(f"Skipping {name}: weights not found at {spec.path}")
+        return True
+    print(f"Exporting {name} ({spec.path})")
+    for backend in targets:
+        path = backends.artifact_path(spec.path, backend)
+        if backend == "torchscript":
+            backends.export_torchscript(spec.load_eager(), path)
+        elif backend == "static_int8":
+            backends.export_static_int8(spec.load_eager(), path, calibration)
+        elif backend == "onnx":
+            try:
+                backends.export_onnx(spec.load_eager(), path)
+            except backends.BackendNotSupported as e:
+                print(f"  skipping onnx: {e}")
+                continue
+        else:
+            continue
+        print(f"  wrote {path}")
+
+    print(f"Validating {name} against the float32 baseline")
+    baseline_probs, baseline_time = run(spec.load_eager(), validation)
+    ok = True
+    for backend in [b for b in backends.BACKENDS if b != "eager"]:
+        if backends.requires_artifact(backend) and not os.path.exists(
+            backends.artifact_path(spec.path, backend)
+        ):
+            continue
+        try:
+            agreement = validate(
+                name, backend, baseline_probs, baseline_time, validation
+            )
+        except backends.BackendNotSupported as e:
+            print(f"  {backend:<13} skipped: {e}")
+            continue
+        if agreement < min_agreement:
+            print(
+                f"  {backend} is below the required "
+                f"{min_agreement * 100:.0f}% agreement"
+            )
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export diagnosis models to optimized CPU backends and check them."
+    )
+    parser.add_argument("--models", nargs="+", default=model_registry.names())
+    parser.add_argument(
+        "--backends", nargs="+", default=["torchscript", "static_int8"],
+        choices=["torchscript", "static_int8", "onnx"],
+    )
+    parser.add_argument(
+        "--calibration-dir", help="Images used to calibrate static int8 quantization"
+    )
+    parser.add_argument(
+        "--validation-dir",
+        help="Images used to compare backends (defaults to calibration images)",
+    )
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    calibration = load_samples(args.calibration_dir, args.samples, args.batch_size)
+    validation = calibration
+    if args.validation_dir:
+        validation = load_samples(args.validation_dir, args.samples, args.batch_size)
+
+    results = [
+        export_model(name, args.backends, calibration, validation, args.min_agreement)
+        for name in args.models
+    ]
+    sys.exit(0 if all(results) else 1)
@@ -1,4 +1,3 @@
-import asyncio
 import sys
 import os
 
@@ -6,7 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import AsyncSessionLocal
+from database import AsyncSessionLocal, run_with_db
 from auth.models import UserStatus
 from auth.queries import get_user_by_username
 
@@ -43,4 +42,4 @@ if __name__ == "__main__":
         sys.exit(1)
     
     username = sys.argv[1]
-    asyncio.run(fix_admin_status(username)) 
\ No newline at end of file
+    run_with_db(fix_admin_status(username)) 
\ No newline at end of file
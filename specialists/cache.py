@@ -0,0 +1,161 @@
+"""
+Read-through cache for the public specialist directory.
+
+GET /specialists/ pages and GET /specialists/{id} profiles are cached as
+rendered JSON together with their ETag, so repeat reads skip both the
+database and serialization, and clients revalidating with If-None-Match get
+a 304. Every write to a specialist calls invalidate(): the profile entry is
+dropped and the listing generation is bumped, which orphans all cached
+pages at once (they then age out of the LRU).
+
+The cache is per process by default, bounded by DR_SKIN_SPECIALIST_CACHE_TTL
+for writes made by other workers or scripts. Set DR_SKIN_SPECIALIST_CACHE_URL
+to a redis:// URL (requires the redis package) to share entries and
+invalidations between workers.
+"""
+import hashlib
+import os
+from typing import List, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from cache import LRUCache
+
+SPECIALIST_CACHE_SIZE = int(os.environ.get("DR_SKIN_SPECIALIST_CACHE_SIZE", "2048"))
+SPECIALIST_CACHE_TTL_SECONDS = float(
+    os.environ.get("DR_SKIN_SPECIALIST_CACHE_TTL", "300")
+)
+SPECIALIST_CACHE_URL = os.environ.get("DR_SKIN_SPECIALIST_CACHE_URL", "")
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: Optional[str] = None
+
+class LocalBackend:
+    """Entries in this process only."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.generation = 0
+
+    async def get(self, key: str) -> Optional[CachedPage]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, page: CachedPage):
+        self.entries.set(key, page)
+
+    async def delete(self, key: str):
+        self.entries.delete(key)
+
+    async def get_generation(self) -> int:
+        return self.generation
+
+    async def bump_generation(self):
+        self.generation += 1
+
+class RedisBackend:
+    """Entries and the listing generation shared through Redis."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "drskin:specialists:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[CachedPage]:
+        fields = await self.client.hgetall(self.prefix + key)
+        if not fields:
+            return None
+        return CachedPage(
+            fields[b"body"],
+            fields[b"etag"].decode(),
+            fields.get(b"next_cursor", b"").decode() or None,
+        )
+
+    async def set(self, key: str, page: CachedPage):
+        mapping = {
+            "body": page.body,
+            "etag": page.etag,
+            "next_cursor": page.next_cursor or "",
+        }
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.prefix + key, mapping=mapping)
+            pipe.expire(self.prefix + key, self.ttl)
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def get_generation(self) -> int:
+        return int(await self.client.get(self.prefix + "generation") or 0)
+
+    async def bump_generation(self):
+        await self.client.incr(self.prefix + "generation")
+
+def create_backend():
+    if SPECIALIST_CACHE_URL:
+        try:
+            return RedisBackend(SPECIALIST_CACHE_URL, SPECIALIST_CACHE_TTL_SECONDS)
+        except ImportError:
+            print(
+                "[DrSkin] redis is not installed, using the in-process specialist cache"
+            )
+    return LocalBackend(SPECIALIST_CACHE_SIZE, SPECIALIST_CACHE_TTL_SECONDS)
+
+class SpecialistCache:
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback() runs on every invalidate(), for data derived from specialists."""
+        self.listeners.append(callback)
+
+    async def listing_key(self, request: Request) -> str:
+        params = urlencode(sorted(request.query_params.multi_items()))
+        return f"list:{await self.backend.get_generation()}:{params}"
+
+    @staticmethod
+    def profile_key(specialist_id: int) -> str:
+        return f"profile:{specialist_id}"
+
+    async def get(self, key: str) -> Optional[CachedPage]:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, page: CachedPage):
+        await self.backend.set(key, page)
+
+    async def invalidate(self, specialist_id: Optional[int] = None):
+        """Call after committing any change to a specialist (or its user)."""
+        if specialist_id is not None:
+            await self.backend.delete(self.profile_key(specialist_id))
+        await self.backend.bump_generation()
+        for callback in self.listeners:
+            callback()
+
+def render(data, next_cursor: Optional[str] = None) -> CachedPage:
+    """Render response data the way FastAPI would, once, and tag it."""
+    body = JSONResponse(jsonable_encoder(data)).body
+    return CachedPage(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', next_cursor)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags: List[str] = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def cached_response(request: Request, page: CachedPage) -> Response:
+    """200 with the cached body, or 304 if the client already has this version."""
+    # no-cache: clients may store the response but must revalidate (cheaply, via
+    # the ETag)
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+specialist_cache = SpecialistCache()
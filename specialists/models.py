@@ -18,7 +18,7 @@ class Specialist(Base):
     bio = Column(Text, nullable=False)
     profile_image = Column(String, nullable=True)
     license_file_path = Column(String, nullable=True)
-    is_approved = Column(Boolean, default=False)
+    is_approved = Column(Boolean, default=False, index=True)
     
     # Relationship with User model
     user = relationship("User", back_populates="specialist") 
\ No newline at end of file
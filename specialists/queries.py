@@ -1,63 +1,104 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, select
+from sqlalchemy.orm import joinedload
 from specialists import models, schemas
+from pagination import paginate
+from specialists.cache import specialist_cache
+from auth.principal import invalidate_user
+from typing import Optional
 from auth.models import UserStatus
+from storage.models import StoredFile
 
-def get_specialist(db: Session, specialist_id: int):
-    return db.query(models.Specialist).filter(models.Specialist.id == specialist_id).first()
+def specialists_query():
+    # SpecialistOut nests the user, and lazy loads can't run under an AsyncSession
+    return select(models.Specialist).options(joinedload(models.Specialist.user))
 
-def get_specialist_by_user_id(db: Session, user_id: int):
-    return db.query(models.Specialist).filter(models.Specialist.user_id == user_id).first()
+async def get_specialist(db: AsyncSession, specialist_id: int):
+    result = await db.execute(specialists_query().where(models.Specialist.id == specialist_id))
+    return result.scalars().first()
 
-def get_specialist_by_phone(db: Session, phone_number: str):
-    return db.query(models.Specialist).filter(models.Specialist.phone_number == phone_number, models.Specialist.is_approved == True).first()
+async def get_specialist_by_user_id(db: AsyncSession, user_id: int):
+    result = await db.execute(
+        specialists_query().where(models.Specialist.user_id == user_id)
+    )
+    return result.scalars().first()
 
-def get_specialist_by_phone_all(db: Session, phone_number: str):
-    return db.query(models.Specialist).filter(models.Specialist.phone_number == phone_number).first()
+async def get_specialist_by_phone(db: AsyncSession, phone_number: str):
+    result = await db.execute(
+        specialists_query().where(models.Specialist.phone_number == phone_number, models.Specialist.is_approved == True)
+    )
+    return result.scalars().first()
 
-def get_specialists(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Specialist).filter(models.Specialist.is_approved == True).offset(skip).limit(limit).all()
+async def get_specialist_by_phone_all(db: AsyncSession, phone_number: str):
+    result = await db.execute(
+        specialists_query().where(models.Specialist.phone_number == phone_number)
+    )
+    return result.scalars().first()
 
-def get_specialists_by_filter(db: Session, filter_params: schemas.SpecialistFilter, skip: int = 0, limit: int = 100):
-    query = db.query(models.Specialist)
+async def get_specialists(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+):
+    query = specialists_query().where(models.Specialist.is_approved == True)
+    result = await db.execute(
+        paginate(query, models.Specialist.id, skip, limit, after_id)
+    )
+    return result.scalars().all()
+
+async def get_specialists_by_filter(db: AsyncSession, filter_params: schemas.SpecialistFilter, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    query = specialists_query()
     
     # Always filter by approved status unless explicitly requested otherwise
     if filter_params.is_approved is None:
-        query = query.filter(models.Specialist.is_approved == True)
+        query = query.where(models.Specialist.is_approved == True)
     else:
-        query = query.filter(models.Specialist.is_approved == filter_params.is_approved)
+        query = query.where(models.Specialist.is_approved == filter_params.is_approved)
     
-    if filter_params.specialization:
-        query = query.filter(models.Specialist.specialization.ilike(f"%{filter_params.specialization}%"))
-    if filter_params.hospital:
-        query = query.filter(models.Specialist.hospital.ilike(f"%{filter_params.hospital}%"))
-    if filter_params.name:
-        query = query.filter(models.Specialist.name.ilike(f"%{filter_params.name}%"))
+    # Word-prefix matches through the full-text index; search imports this module
+    from specialists.search import column_filters
+    query = column_filters(query, {
+        "name": filter_params.name,
+        "specialization": filter_params.specialization,
+        "hospital": filter_params.hospital,
+    })
     if filter_params.phone_number:
-        query = query.filter(models.Specialist.phone_number.ilike(f"%{filter_params.phone_number}%"))
-    
-    return query.offset(skip).limit(limit).all()
+        # Served by the column's unique index
+        query = query.where(models.Specialist.phone_number == filter_params.phone_number)
+
+    result = await db.execute(
+        paginate(query, models.Specialist.id, skip, limit, after_id)
+    )
+    return result.scalars().all()
 
-def create_specialist(db: Session, specialist: schemas.SpecialistCreate, user_id: int):
+async def create_specialist(
+    db: AsyncSession, specialist: schemas.SpecialistCreate, user_id: int
+):
     db_specialist = models.Specialist(**specialist.dict(), user_id=user_id)
     db.add(db_specialist)
-    db.commit()
-    db.refresh(db_specialist)
-    return db_specialist
+    await db.commit()
+    await specialist_cache.invalidate(db_specialist.id)
+    return await get_specialist(db, db_specialist.id)
 
-def update_specialist(db: Session, specialist: models.Specialist):
-    db.commit()
-    db.refresh(specialist)
+async def update_specialist(db: AsyncSession, specialist: models.Specialist):
+    await db.commit()
+    await specialist_cache.invalidate(specialist.id)
+    await db.refresh(specialist)
     return specialist
 
-def approve_specialist(db: Session, specialist: models.Specialist):
+async def approve_specialist(db: AsyncSession, specialist: models.Specialist):
     specialist.is_approved = True
     specialist.user.status = UserStatus.ACTIVE
-    db.commit()
-    db.refresh(specialist)
+    await db.commit()
+    await specialist_cache.invalidate(specialist.id)
+    invalidate_user(specialist.user.username)
+    await db.refresh(specialist)
     return specialist
 
-def delete_specialist(db: Session, specialist: models.Specialist):
-    db.delete(specialist)
-    db.commit()
-    return specialist 
\ No newline at end of file
+async def delete_specialist(db: AsyncSession, specialist: models.Specialist):
+    # Blobs stay in storage; they may be shared with other uploads
+    await db.execute(
+        delete(StoredFile).where(StoredFile.specialist_id == specialist.id)
+    )
+    await db.delete(specialist)
+    await db.commit()
+    await specialist_cache.invalidate(specialist.id)
+    return specialist
\ No newline at end of file
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from specialists import models, schemas, queries, transactions
-from auth.routes import get_current_user
-from auth.models import User, UserType, UserStatus
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from specialists import models, schemas, queries, transactions, search
+from specialists.cache import specialist_cache, render, cached_response
+from auth.routes import get_current_user, get_current_principal
+from auth.principal import Principal, invalidate_user
+from auth.models import UserType, UserStatus
 from database import get_db
+from pagination import decode_cursor, split_page, set_next_page_headers
 from typing import Optional
 
 # Dependency to require admin
-def require_admin(current_user: User = Depends(get_current_user)):
+def require_admin(current_user: Principal = Depends(get_current_principal)):
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -16,13 +19,13 @@ def require_admin(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Dependency to require specialist
-def require_specialist(current_user: User = Depends(get_current_user)):
+def require_specialist(current_user: Principal = Depends(get_current_user)):
     if current_user.user_type != UserType.SPECIALIST:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
-    if not current_user.is_active or getattr(current_user, 'status', None) != 'active':
+    if not current_user.is_active or current_user.status != UserStatus.ACTIVE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Specialist account is not active"
@@ -31,9 +34,9 @@ def require_specialist(current_user: User = Depends(get_current_user)):
 
 router = APIRouter(prefix="/specialists", tags=["specialists"])
 
-def get_current_specialist(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_current_specialist(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.user_type != UserType.SPECIALIST:  # UserType.SPECIALIST
         raise HTTPException(
@@ -45,7 +48,7 @@ def get_current_specialist(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Specialist account is not active"
         )
-    specialist = queries.get_specialist_by_user_id(db, current_user.id)
+    specialist = await queries.get_specialist_by_user_id(db, current_user.id)
     if not specialist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -61,64 +64,115 @@ async def read_specialist_me(current_specialist: models.Specialist = Depends(get
 async def update_specialist_profile(
     specialist_update: schemas.SpecialistUpdate,
     current_specialist: models.Specialist = Depends(get_current_specialist),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    updated_specialist, error = transactions.update_specialist_transaction(db, current_specialist.id, specialist_update)
+    updated_specialist, error = await transactions.update_specialist_transaction(db, current_specialist.id, specialist_update)
     if error:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return updated_specialist
 
 @router.get("/", response_model=list[schemas.SpecialistOut])
 async def list_specialists(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(
+        None, description="X-Next-Cursor from the previous page; replaces skip"
+    ),
     specialization: Optional[str] = None,
     hospital: Optional[str] = None,
     name: Optional[str] = None,
     is_approved: Optional[bool] = None,
     phone_number: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    filter_params = schemas.SpecialistFilter(
-        specialization=specialization,
-        hospital=hospital,
-        name=name,
-        is_approved=is_approved,
-        phone_number=phone_number
-    )
-    return queries.get_specialists_by_filter(db, filter_params, skip=skip, limit=limit)
+    key = await specialist_cache.listing_key(request)
+    cached = await specialist_cache.get(key)
+    if cached is None:
+        filter_params = schemas.SpecialistFilter(
+            specialization=specialization,
+            hospital=hospital,
+            name=name,
+            is_approved=is_approved,
+            phone_number=phone_number
+        )
+        specialists = await queries.get_specialists_by_filter(
+            db,
+            filter_params,
+            skip=skip,
+            limit=limit + 1,
+            after_id=decode_cursor(cursor),
+        )
+        page, next_cursor = split_page(specialists, limit)
+        cached = render(
+            [schemas.SpecialistOut.from_orm(specialist) for specialist in page],
+            next_cursor,
+        )
+        await specialist_cache.set(key, cached)
+    response = cached_response(request, cached)
+    set_next_page_headers(request, response, cached.next_cursor)
+    return response
+
+# Declared before /{specialist_id} so "search" isn't parsed as an id
+@router.get("/search", response_model=list[schemas.SpecialistOut])
+async def search_specialists(
+    q: str = Query(
+        ...,
+        min_length=1,
+        max_length=200,
+        description="Words to look for in name, specialization, hospital and bio",
+    ),
+    skip: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Ranked full-text search of approved specialists; words match as prefixes."""
+    return await search.search_specialists(db, q, skip=skip, limit=limit)
 
 @router.post("/{specialist_id}/approve", response_model=schemas.SpecialistOut)
 async def approve_specialist(
     specialist_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ): 
     if current_user.user_type != UserType.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can approve specialists"
         )
-    db_specialist, error = transactions.approve_specialist_transaction(db, specialist_id)
-    if error:
+    db_specialist, error = await transactions.approve_specialist_transaction(db, specialist_id)
+    if error == "Specialist not found":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=error)
+    if error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return db_specialist
 
 @router.get("/{specialist_id}", response_model=schemas.SpecialistOut)
-async def get_specialist(specialist_id: int, db: Session = Depends(get_db)):
-    specialist = queries.get_specialist(db, specialist_id)
-    if not specialist or not specialist.is_approved or not specialist.user.is_active:
-        raise HTTPException(status_code=404, detail="Specialist not found")
-    return specialist
+async def get_specialist(
+    specialist_id: int, request: Request, db: AsyncSession = Depends(get_db)
+):
+    key = specialist_cache.profile_key(specialist_id)
+    cached = await specialist_cache.get(key)
+    if cached is None:
+        specialist = await queries.get_specialist(db, specialist_id)
+        if (
+            not specialist
+            or not specialist.is_approved
+            or not specialist.user.is_active
+        ):
+            raise HTTPException(status_code=404, detail="Specialist not found")
+        cached = render(schemas.SpecialistOut.from_orm(specialist))
+        await specialist_cache.set(key, cached)
+    return cached_response(request, cached)
 
 @router.patch("/{specialist_id}", response_model=schemas.SpecialistOut)
 async def admin_update_specialist(
     specialist_id: int,
     specialist_update: schemas.SpecialistUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(require_admin)
 ):
-    updated_specialist, error = transactions.update_specialist_transaction(db, specialist_id, specialist_update)
+    updated_specialist, error = await transactions.update_specialist_transaction(db, specialist_id, specialist_update)
     if error:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return updated_specialist
@@ -126,32 +180,44 @@ async def admin_update_specialist(
 @router.post("/{specialist_id}/reject", response_model=schemas.SpecialistOut)
 async def reject_specialist(
     specialist_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(require_admin)
 ):
-    db_specialist = queries.get_specialist(db, specialist_id)
+    db_specialist = await queries.get_specialist(db, specialist_id)
     if not db_specialist:
         raise HTTPException(status_code=404, detail="Specialist not found")
     db_specialist.is_approved = False
     db_specialist.user.status = UserStatus.INACTIVE
     db_specialist.user.is_active = False
-    db.commit()
-    db.refresh(db_specialist)
+    await db.commit()
+    await specialist_cache.invalidate(db_specialist.id)
+    invalidate_user(db_specialist.user.username)
+    await db.refresh(db_specialist)
     return db_specialist
 
 @router.post("/filter", response_model=list[schemas.SpecialistOut])
 async def filter_specialists(
     filter: schemas.SpecialistFilter,
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(
+        None, description="X-Next-Cursor from the previous page; replaces skip"
+    ),
+    db: AsyncSession = Depends(get_db),
 ):
-    return queries.get_specialists_by_filter(db, filter, skip=skip, limit=limit)
+    specialists = await queries.get_specialists_by_filter(
+        db, filter, skip=skip, limit=limit + 1, after_id=decode_cursor(cursor)
+    )
+    page, next_cursor = split_page(specialists, limit)
+    set_next_page_headers(request, response, next_cursor)
+    return page
 
 # Auth Endpoint (login by phone number)
 @router.post("/login", response_model=schemas.SpecialistOut)
-async def login(phone_number: str, db: Session = Depends(get_db)):
-    specialist = queries.get_specialist_by_phone(db, phone_number)
+async def login(phone_number: str, db: AsyncSession = Depends(get_db)):
+    specialist = await queries.get_specialist_by_phone(db, phone_number)
     if not specialist or not specialist.is_approved or not specialist.user.is_active:
         raise HTTPException(status_code=404, detail="Specialist not found or not approved")
     return specialist 
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Full-text search over the specialist directory.
+
+SQLite databases get an FTS5 table (specialists_fts) over name,
+specialization, hospital and bio, kept in sync with the specialists table by
+triggers and ranked with bm25. PostgreSQL gets a GIN index over a weighted
+tsvector of the same columns, ranked with ts_rank_cd. Other backends, or
+SQLite builds without FTS5, fall back to unranked ILIKE matching.
+
+The name, specialization and hospital filters of the specialist listings
+use the same index, restricted to their column (see column_filters).
+"""
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import (
+    Index,
+    and_,
+    column,
+    false,
+    func,
+    literal_column,
+    or_,
+    table,
+    text,
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from specialists import models
+from specialists.queries import specialists_query
+
+FTS_TABLE = "specialists_fts"
+SEARCH_COLUMNS = ("name", "specialization", "hospital", "bio")
+# Relative importance of a match in each of SEARCH_COLUMNS
+SQLITE_BM25_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+# One label per column, so a filter can be restricted to its column
+POSTGRES_WEIGHTS = ("A", "B", "C", "D")
+# ts_rank_cd's weight for each label, in {D, C, B, A} order, matching
+# SQLITE_BM25_WEIGHTS
+POSTGRES_RANK_WEIGHTS = "{0.1, 0.3, 0.5, 1.0}"
+POSTGRES_INDEX = "ix_specialists_document"
+# Built by earlier versions with C shared by specialization and hospital
+OBSOLETE_POSTGRES_INDEX = "ix_specialists_search"
+# Extra words in a query are ignored
+MAX_SEARCH_TERMS = 8
+
+SQLITE_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, specialization, hospital, bio,
+        content='specialists', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON specialists BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, specialization, hospital, bio)
+        VALUES (new.id, new.name, new.specialization, new.hospital, new.bio);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON specialists BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, specialization, hospital, bio)
+        VALUES ('delete', old.id, old.name, old.specialization, old.hospital, old.bio);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, specialization, hospital, bio ON specialists BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, specialization, hospital, bio)
+        VALUES ('delete', old.id, old.name, old.specialization, old.hospital, old.bio);
+        INSERT INTO {FTS_TABLE}(rowid, name, specialization, hospital, bio)
+        VALUES (new.id, new.name, new.specialization, new.hospital, new.bio);
+    END
+    """,
+]
+
+# "fts5", "tsvector" or "like"; set by init_search_index
+search_backend = "like"
+
+def postgres_document():
+    """Weighted tsvector of the searchable columns, shared by the index and queries."""
+    document = None
+    for name, weight in zip(SEARCH_COLUMNS, POSTGRES_WEIGHTS):
+        vector = func.setweight(
+            func.to_tsvector(
+                literal_column("'simple'"),
+                func.coalesce(getattr(models.Specialist, name), literal_column("''")),
+            ),
+            literal_column(f"'{weight}'"),
+        )
+        document = vector if document is None else document.op("||")(vector)
+    return document
+
+def create_sqlite_fts(connection) -> bool:
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE},
+    ).first()
+    try:
+        for statement in SQLITE_FTS_DDL:
+            connection.execute(text(statement))
+    except OperationalError as e:
+        print(f"[DrSkin] FTS5 not available, specialist search falls back to LIKE: {e}")
+        return False
+    if not exists:
+        # Index the specialists that were there before the search table
+        connection.execute(
+            text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        )
+    return True
+
+def create_postgres_index(connection) -> bool:
+    connection.execute(text(f"DROP INDEX IF EXISTS {OBSOLETE_POSTGRES_INDEX}"))
+    Index(POSTGRES_INDEX, postgres_document(), postgresql_using="gin").create(
+        connection, checkfirst=True
+    )
+    return True
+
+async def init_search_index(engine):
+    """Create (or upgrade an existing database to) this backend's full-text index."""
+    global search_backend
+    dialect = engine.dialect.name
+    async with engine.begin() as conn:
+        if dialect == "sqlite" and await conn.run_sync(create_sqlite_fts):
+            search_backend = "fts5"
+        elif dialect == "postgresql" and await conn.run_sync(create_postgres_index):
+            search_backend = "tsvector"
+        else:
+            search_backend = "like"
+
+def search_terms(q: str) -> List[str]:
+    # Only word characters reach the FTS/tsquery syntax, so user input can't break it
+    return re.findall(r"\w+", q.lower())[:MAX_SEARCH_TERMS]
+
+async def search_specialists(db: AsyncSession, q: str, skip: int = 0, limit: int = 20):
+    """Approved specialists matching every word of q as a prefix, best matches first."""
+    terms = search_terms(q)
+    if not terms:
+        return []
+    query = specialists_query().where(models.Specialist.is_approved.is_(True))
+
+    if search_backend == "fts5":
+        fts = table(FTS_TABLE, column("rowid"))
+        match = " ".join(f'"{term}"*' for term in terms)
+        query = (
+            query.join(fts, fts.c.rowid == models.Specialist.id)
+            .where(literal_column(FTS_TABLE).op("MATCH")(match))
+            .order_by(
+                func.bm25(literal_column(FTS_TABLE), *SQLITE_BM25_WEIGHTS),
+                models.Specialist.id,
+            )
+        )
+    elif search_backend == "tsvector":
+        document = postgres_document()
+        tsquery = func.to_tsquery(
+            literal_column("'simple'"), " & ".join(f"{term}:*" for term in terms)
+        )
+        query = query.where(document.op("@@")(tsquery)).order_by(
+            func.ts_rank_cd(
+                literal_column(f"'{POSTGRES_RANK_WEIGHTS}'"), document, tsquery
+            ).desc(),
+            models.Specialist.id,
+        )
+    else:
+        columns = [getattr(models.Specialist, name) for name in SEARCH_COLUMNS]
+        query = query.where(
+            and_(*[or_(*[c.ilike(f"%{term}%") for c in columns]) for term in terms])
+        ).order_by(models.Specialist.name, models.Specialist.id)
+
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.scalars().all()
+
+def column_filters(query, filters: Dict[str, Optional[str]]):
+    """
+    Restrict a specialists query so that, for each column given a value in
+    filters, every word of the value starts a word in that column.
+    """
+    terms = {name: search_terms(value) for name, value in filters.items() if value}
+    if any(not words for words in terms.values()):
+        # A value with no words in it can't match anything
+        return query.where(false())
+    if not terms:
+        return query
+
+    if search_backend == "fts5":
+        fts = table(FTS_TABLE, column("rowid"))
+        match = " ".join(
+            f'{name} : "{term}"*' for name, words in terms.items() for term in words
+        )
+        return query.join(fts, fts.c.rowid == models.Specialist.id).where(
+            literal_column(FTS_TABLE).op("MATCH")(match)
+        )
+    if search_backend == "tsvector":
+        labels = dict(zip(SEARCH_COLUMNS, POSTGRES_WEIGHTS))
+        tsquery = func.to_tsquery(
+            literal_column("'simple'"),
+            " & ".join(
+                f"{term}:*{labels[name]}"
+                for name, words in terms.items()
+                for term in words
+            ),
+        )
+        return query.where(postgres_document().op("@@")(tsquery))
+    for name, words in terms.items():
+        query = query.where(
+            and_(
+                *[getattr(models.Specialist, name).ilike(f"%{term}%") for term in words]
+            )
+        )
+    return query
@@ -1,11 +1,13 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from specialists import models, schemas
 from auth.models import UserStatus
 from specialists.queries import get_specialist, get_specialist_by_user_id
+from specialists.cache import specialist_cache
+from auth.principal import invalidate_user
 
-def update_specialist_transaction(db: Session, specialist_id: int, specialist_update: schemas.SpecialistUpdate):
+async def update_specialist_transaction(db: AsyncSession, specialist_id: int, specialist_update: schemas.SpecialistUpdate):
     # Get the specialist
-    db_specialist = get_specialist(db, specialist_id)
+    db_specialist = await get_specialist(db, specialist_id)
     if not db_specialist:
         return None, "Specialist not found"
     
@@ -14,21 +16,27 @@ def update_specialist_transaction(db: Session, specialist_id: int, specialist_up
     for field, value in update_data.items():
         setattr(db_specialist, field, value)
     
-    db.commit()
-    db.refresh(db_specialist)
+    await db.commit()
+    await specialist_cache.invalidate(db_specialist.id)
+    await db.refresh(db_specialist)
     return db_specialist, None
 
-def approve_specialist_transaction(db: Session, specialist_id: int):
+async def approve_specialist_transaction(db: AsyncSession, specialist_id: int):
     # Get the specialist
-    db_specialist = get_specialist(db, specialist_id)
+    db_specialist = await get_specialist(db, specialist_id)
     if not db_specialist:
         return None, "Specialist not found"
+    if not db_specialist.license_file_path:
+        # Unset when the uploaded license failed verification
+        return None, "Specialist has no valid license file"
     
     # Approve the specialist
     db_specialist.is_approved = True
     db_specialist.user.status = UserStatus.ACTIVE
     db_specialist.user.is_active = True
     
-    db.commit()
-    db.refresh(db_specialist)
-    return db_specialist, None 
\ No newline at end of file
+    await db.commit()
+    await specialist_cache.invalidate(db_specialist.id)
+    invalidate_user(db_specialist.user.username)
+    await db.refresh(db_specialist)
+    return db_specialist, None
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Content-addressed blob storage for uploaded files.
+
+A blob is stored once under its sha256, sharded two levels deep
+(ab/cd/abcd...), so identical uploads share one copy and no directory grows
+past a few hundred entries. Which specialist uploaded what, and under which
+original name and content type, is recorded in the stored_files table.
+Derived files (the thumbnails made by storage.serving) are kept by the same
+backend under thumbnails/, and images waiting for a diagnosis job under
+diagnosis/.
+
+DR_SKIN_STORAGE_BACKEND selects where blobs live:
+
+- local: a directory, DR_SKIN_STORAGE_ROOT (uploads/blobs)
+- s3:    bucket DR_SKIN_S3_BUCKET under DR_SKIN_S3_PREFIX, on AWS or any
+         S3-compatible server (MinIO, a local stand-in) at
+         DR_SKIN_S3_ENDPOINT_URL; needs the optional boto3 package and takes
+         credentials from the usual AWS_* variables
+"""
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from auth.uploads import UPLOAD_CHUNK_SIZE, StagedUpload, remove_quietly
+
+STORAGE_BACKEND = os.environ.get("DR_SKIN_STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.environ.get("DR_SKIN_STORAGE_ROOT", "uploads/blobs")
+S3_BUCKET = os.environ.get("DR_SKIN_S3_BUCKET", "")
+S3_PREFIX = os.environ.get("DR_SKIN_S3_PREFIX", "blobs/")
+S3_ENDPOINT_URL = os.environ.get("DR_SKIN_S3_ENDPOINT_URL", "")
+
+class StorageNotAvailable(Exception):
+    pass
+
+def blob_key(sha256: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def file_extension(filename: Optional[str]) -> str:
+    """Lowercased extension of an uploaded file name, or "" if it doesn't have one."""
+    suffix = Path(filename or "").suffix.lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,10}", suffix) else ""
+
+async def iter_file(
+    path: Path, start: int = 0, end: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Bytes start..end (inclusive, None for the end of the file) of a file, read in
+    the threadpool.
+    """
+    with await run_in_threadpool(open, path, "rb") as f:
+        if start:
+            await run_in_threadpool(f.seek, start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = (
+                UPLOAD_CHUNK_SIZE
+                if remaining is None
+                else min(UPLOAD_CHUNK_SIZE, remaining)
+            )
+            chunk = await run_in_threadpool(f.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = Path(root)
+        # Staged uploads go on the same filesystem, so storing one is a rename
+        self.staging_dir = self.root / ".staging"
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self.path(key).is_file)
+
+    async def put(self, staged: StagedUpload) -> str:
+        """Store a staged upload under its hash, unless that blob is already there."""
+        key = blob_key(staged.sha256)
+        if await self.exists(key):
+            await staged.discard()
+            return key
+        path = self.path(key)
+        await run_in_threadpool(path.parent.mkdir, parents=True, exist_ok=True)
+        await staged.commit(path)
+        return key
+
+    def iter_chunks(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        return iter_file(self.path(key), start, end)
+
+    async def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            return await run_in_threadpool(self.path(key).read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def put_bytes(
+        self, key: str, data: bytes, content_type: Optional[str] = None
+    ):
+        path = self.path(key)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=self.staging_dir, prefix=".put-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_name, path)
+
+        await run_in_threadpool(write)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(remove_quietly, self.path(key))
+
+class S3Storage:
+    def __init__(
+        self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None
+    ):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise StorageNotAvailable(
+                "The s3 storage backend requires the boto3 package"
+            ) from e
+        if not bucket:
+            raise StorageNotAvailable(
+                "The s3 storage backend requires DR_SKIN_S3_BUCKET"
+            )
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.client_error = ClientError
+        self.bucket = bucket
+        self.prefix = prefix
+        self.staging_dir = Path(tempfile.gettempdir())
+
+    @staticmethod
+    def is_not_found(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in (
+            "404",
+            "NoSuchKey",
+            "NotFound",
+        )
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await run_in_threadpool(
+                self.client.head_object, Bucket=self.bucket, Key=self.prefix + key
+            )
+            return True
+        except self.client_error as e:
+            if self.is_not_found(e):
+                return False
+            raise
+
+    async def put(self, staged: StagedUpload) -> str:
+        key = blob_key(staged.sha256)
+        try:
+            if not await self.exists(key):
+                extra = (
+                    {"ContentType": staged.content_type}
+                    if staged.content_type
+                    else None
+                )
+                await run_in_threadpool(
+                    self.client.upload_file,
+                    str(staged.temp_path),
+                    self.bucket,
+                    self.prefix + key,
+                    ExtraArgs=extra,
+                )
+        finally:
+            await staged.discard()
+        return key
+
+    async def iter_chunks(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": self.prefix + key}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        result = await run_in_threadpool(self.client.get_object, **params)
+        body = result["Body"]
+        try:
+            while True:
+                chunk = await run_in_threadpool(body.read, UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            result = await run_in_threadpool(
+                self.client.get_object, Bucket=self.bucket, Key=self.prefix + key
+            )
+        except self.client_error as e:
+            if self.is_not_found(e):
+                return None
+            raise
+        return await run_in_threadpool(result["Body"].read)
+
+    async def put_bytes(
+        self, key: str, data: bytes, content_type: Optional[str] = None
+    ):
+        extra = {"ContentType": content_type} if content_type else {}
+        await run_in_threadpool(
+            self.client.put_object,
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            **extra,
+        )
+
+    async def delete(self, key: str):
+        # Deleting a missing key is not an error in S3
+        await run_in_threadpool(
+            self.client.delete_object, Bucket=self.bucket, Key=self.prefix + key
+        )
+
+def create_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+    if STORAGE_BACKEND != "local":
+        raise StorageNotAvailable(
+            f"Unknown storage backend {STORAGE_BACKEND!r}, expected local or s3"
+        )
+    return LocalStorage(STORAGE_ROOT)
+
+file_storage = create_storage()
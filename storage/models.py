@@ -0,0 +1,37 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    func,
+)
+
+from models import Base
+
+
+class StoredFile(Base):
+    """A specialist's upload: which blob holds it and what it was called."""
+    __tablename__ = 'stored_files'
+    __table_args__ = (UniqueConstraint('specialist_id', 'kind'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    specialist_id = Column(
+        Integer, ForeignKey("specialists.id"), nullable=False, index=True
+    )
+    kind = Column(String, nullable=False)  # "license" or "profile"
+    sha256 = Column(String(64), nullable=False, index=True)
+    extension = Column(String, nullable=False, default="")
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    original_filename = Column(String, nullable=True)
+    # Why the file failed verification; it is then no longer linked from the profile
+    rejected_reason = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    @property
+    def name(self) -> str:
+        """Public file name, the {filename} of the /auth/files/ routes."""
+        return self.sha256 + self.extension
@@ -0,0 +1,179 @@
+"""
+Post-upload processing, run as a background job after registration.
+
+For each stored file the job checks that the contents really are a PDF,
+JPEG, PNG or WebP (and, for images, that Pillow can decode them), corrects
+the recorded content type and extension, re-encodes profile images that are
+oversized or carry EXIF metadata, and renders the thumbnails the admin
+review screen asks for, so the first view doesn't pay for them.
+
+A file that fails the checks is flagged with the reason, unlinked from the
+specialist's profile (so a specialist whose license was rejected can't be
+approved) and reported to the admins.
+"""
+import hashlib
+import io
+import os
+from typing import Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from auth.notifications import NOTIFY_REJECTED_UPLOAD_JOB
+from database import AsyncSessionLocal
+from jobs.worker import PermanentJobError, enqueue, job_handler, job_worker
+from specialists.cache import specialist_cache
+from specialists.models import Specialist
+from storage.backends import blob_key, file_storage
+from storage.models import StoredFile
+from storage.serving import THUMBNAIL_SIZES, blob_source, cached_thumbnail
+
+PROCESS_UPLOAD_JOB = "storage.process_upload"
+
+# Profile images are scaled down to fit this many pixels on their longer side
+PROFILE_IMAGE_MAX_PX = int(os.environ.get("DR_SKIN_PROFILE_IMAGE_MAX_PX", "1024"))
+PROFILE_IMAGE_QUALITY = int(os.environ.get("DR_SKIN_PROFILE_IMAGE_QUALITY", "88"))
+# Thumbnail sizes rendered ahead of time, in both formats
+PRERENDER_THUMBNAIL_SIZES = tuple(
+    int(size)
+    for size in os.environ.get("DR_SKIN_PRERENDER_THUMBNAIL_SIZES", "128,256").split(
+        ","
+    )
+    if size
+)
+
+# Specialist column and /auth/files/ directory for each kind of upload
+PROFILE_FIELDS = {
+    "license": ("license_file_path", "licenses"),
+    "profile": ("profile_image", "profiles"),
+}
+
+SIGNATURES = (
+    (b"%PDF-", "application/pdf", ".pdf"),
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+)
+
+def sniff_media_type(data: bytes) -> Optional[Tuple[str, str]]:
+    """(media type, extension) from a file's leading bytes; None if not accepted."""
+    for signature, media_type, extension in SIGNATURES:
+        if data.startswith(signature):
+            return media_type, extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    return None
+
+def verify_image(data: bytes):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (
+        UnidentifiedImageError,
+        Image.DecompressionBombError,
+        OSError,
+        SyntaxError,
+    ) as e:
+        raise PermanentJobError(f"Image could not be decoded: {e}") from e
+
+def normalize_profile_image(data: bytes) -> Optional[Tuple[bytes, str, str]]:
+    """
+    Upright, metadata-free, at most PROFILE_IMAGE_MAX_PX image, or None if data
+    already is one.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        oversized = max(image.size) > PROFILE_IMAGE_MAX_PX
+        if not oversized and not image.getexif() and not image.info.get("exif"):
+            return None
+        image.draft("RGB", (PROFILE_IMAGE_MAX_PX, PROFILE_IMAGE_MAX_PX))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PROFILE_IMAGE_MAX_PX, PROFILE_IMAGE_MAX_PX))
+        output = io.BytesIO()
+        if "A" in image.getbands() or image.mode == "P":
+            image.save(output, format="PNG", optimize=True)
+            return output.getvalue(), "image/png", ".png"
+        image.convert("RGB").save(
+            output, format="JPEG", quality=PROFILE_IMAGE_QUALITY, optimize=True
+        )
+        return output.getvalue(), "image/jpeg", ".jpg"
+
+def link_to_profile(specialist: Specialist, stored: Optional[StoredFile], kind: str):
+    """Point the specialist's column for this kind of file at stored; None clears it."""
+    field, directory = PROFILE_FIELDS[kind]
+    setattr(
+        specialist, field, f"{directory}/{stored.name}" if stored is not None else None
+    )
+
+@job_handler(PROCESS_UPLOAD_JOB)
+async def process_upload(payload: dict):
+    try:
+        await verify_upload(payload["stored_file_id"])
+    except PermanentJobError as e:
+        await reject_upload(payload["stored_file_id"], str(e))
+        raise
+
+async def verify_upload(stored_file_id: int):
+    async with AsyncSessionLocal() as db:
+        stored = await db.get(StoredFile, stored_file_id)
+        if stored is None:
+            # The specialist was deleted meanwhile
+            return
+        data = await file_storage.read_bytes(blob_key(stored.sha256))
+        if data is None:
+            raise PermanentJobError(f"Blob {stored.sha256} is missing from storage")
+
+        detected = sniff_media_type(data)
+        if detected is None or (
+            stored.kind == "profile" and not detected[0].startswith("image/")
+        ):
+            raise PermanentJobError(
+                f"{stored.kind} upload {stored.original_filename!r} "
+                "is not an accepted file type"
+            )
+        media_type, extension = detected
+        stored.content_type = media_type
+        is_image = media_type.startswith("image/")
+        if is_image:
+            await run_in_threadpool(verify_image, data)
+        if stored.kind == "profile":
+            normalized = await run_in_threadpool(normalize_profile_image, data)
+            if normalized is not None:
+                data, stored.content_type, extension = normalized
+                stored.sha256 = hashlib.sha256(data).hexdigest()
+                stored.size = len(data)
+                if not await file_storage.exists(blob_key(stored.sha256)):
+                    await file_storage.put_bytes(
+                        blob_key(stored.sha256), data, stored.content_type
+                    )
+        # The extension the client sent may not match what the file turned out to be
+        stored.extension = extension
+        link_to_profile(
+            await db.get(Specialist, stored.specialist_id), stored, stored.kind
+        )
+        await db.commit()
+        await specialist_cache.invalidate(stored.specialist_id)
+        if not is_image:
+            return
+
+        source = blob_source(stored)
+        for size in PRERENDER_THUMBNAIL_SIZES:
+            if size in THUMBNAIL_SIZES:
+                for image_format in ("WEBP", "JPEG"):
+                    await cached_thumbnail(source, size, image_format)
+
+async def reject_upload(stored_file_id: int, reason: str):
+    """
+    Flag a file that failed verification, unlink it from the profile and queue an
+    admin notification.
+    """
+    async with AsyncSessionLocal() as db:
+        stored = await db.get(StoredFile, stored_file_id)
+        if stored is None:
+            return
+        stored.rejected_reason = reason
+        link_to_profile(
+            await db.get(Specialist, stored.specialist_id), None, stored.kind
+        )
+        await enqueue(db, NOTIFY_REJECTED_UPLOAD_JOB, {"stored_file_id": stored.id})
+        await db.commit()
+    await specialist_cache.invalidate(stored.specialist_id)
+    job_worker.wake()
@@ -0,0 +1,33 @@
+import re
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from storage import models
+
+
+async def get_stored_file(db: AsyncSession, specialist_id: int, kind: str):
+    result = await db.execute(
+        select(models.StoredFile).where(
+            models.StoredFile.specialist_id == specialist_id,
+            models.StoredFile.kind == kind,
+        )
+    )
+    return result.scalars().first()
+
+async def get_stored_file_by_name(
+    db: AsyncSession, kind: str, name: str
+) -> Optional[models.StoredFile]:
+    """Look up a file by its public name ({sha256}{extension})."""
+    match = re.fullmatch(r"([0-9a-f]{64})(\.[a-z0-9]{1,10})?", name)
+    if not match:
+        return None
+    result = await db.execute(
+        select(models.StoredFile).where(
+            models.StoredFile.kind == kind,
+            models.StoredFile.sha256 == match.group(1),
+            models.StoredFile.extension == (match.group(2) or ""),
+        ).limit(1)
+    )
+    return result.scalars().first()
@@ -0,0 +1,277 @@
+"""
+HTTP serving of uploaded files for the /auth/files routes.
+
+Responses carry an ETag, Last-Modified and Cache-Control, answer
+If-None-Match / If-Modified-Since with 304, and honour a single byte Range
+(with If-Range) so large scans can be resumed or read in parts. Blobs are
+addressed by content, so their ETag is their hash and browsers may keep
+them for a year; files from before content-addressed storage are
+revalidated on every use.
+
+?size=N returns a downscaled preview, at most N pixels on its longer side,
+as WebP when the client accepts it and JPEG otherwise. N must be one of
+DR_SKIN_THUMBNAIL_SIZES. Previews are rendered once with Pillow in the
+threadpool and then kept in file storage.
+"""
+import hashlib
+import io
+import mimetypes
+import os
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from stat import S_ISREG
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from storage.backends import blob_key, file_storage, iter_file
+
+THUMBNAIL_SIZES = tuple(
+    int(size)
+    for size in os.environ.get("DR_SKIN_THUMBNAIL_SIZES", "128,256,512,1024").split(",")
+)
+THUMBNAIL_QUALITY = int(os.environ.get("DR_SKIN_THUMBNAIL_QUALITY", "80"))
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+class FileSource:
+    """What serve_file needs to know about a file, wherever it is stored."""
+
+    def __init__(
+        self,
+        etag: str,
+        modified: datetime,
+        size: int,
+        media_type: str,
+        cache_id: str,
+        immutable: bool,
+        reader,
+    ):
+        self.etag = etag
+        self.modified = modified
+        self.size = size
+        self.media_type = media_type
+        # Identifies this exact content, for naming its thumbnails
+        self.cache_id = cache_id
+        self.immutable = immutable
+        self.reader = reader
+
+    def iter_chunks(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        return self.reader(start, end)
+
+    async def read_bytes(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks()])
+
+def blob_source(stored) -> FileSource:
+    key = blob_key(stored.sha256)
+    modified = stored.created_at or datetime.now(timezone.utc)
+    return FileSource(
+        etag=f'"{stored.sha256}"',
+        modified=modified.replace(tzinfo=modified.tzinfo or timezone.utc),
+        size=stored.size,
+        media_type=stored.content_type or "application/octet-stream",
+        cache_id=stored.sha256,
+        immutable=True,
+        reader=lambda start, end: file_storage.iter_chunks(key, start, end),
+    )
+
+async def path_source(path: Path) -> Optional[FileSource]:
+    """A file under uploads/ by path, or None if there is no such file."""
+    try:
+        stat = await run_in_threadpool(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not S_ISREG(stat.st_mode):
+        return None
+    version = f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+    cache_id = hashlib.sha256(version.encode()).hexdigest()
+    return FileSource(
+        etag=f'"{cache_id[:32]}"',
+        modified=datetime.fromtimestamp(int(stat.st_mtime), timezone.utc),
+        size=stat.st_size,
+        media_type=mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+        cache_id=cache_id,
+        immutable=False,
+        reader=lambda start, end: iter_file(path, start, end),
+    )
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def not_modified_since(header: Optional[str], modified: datetime) -> bool:
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return modified.replace(microsecond=0) <= since
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single "bytes=" range, None to send the whole file.
+
+    Raises HTTPException 416 when the range lies entirely past the end of the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        # Multiple ranges are allowed to be answered with the full file
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def serve_source(
+    request: Request, source: FileSource, vary: Optional[str] = None
+) -> Response:
+    cache_control = REVALIDATE_CACHE_CONTROL
+    if source.immutable:
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    headers = {
+        "ETag": source.etag,
+        "Last-Modified": formatdate(source.modified.timestamp(), usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if vary:
+        headers["Vary"] = vary
+
+    # If-Modified-Since only counts when the client sent no ETag to compare
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, source.etag) or (
+        not if_none_match
+        and not_modified_since(
+            request.headers.get("if-modified-since"), source.modified
+        )
+    ):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == source.etag:
+        byte_range = parse_range(request.headers.get("range"), source.size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(source.size)
+        return StreamingResponse(
+            source.iter_chunks(), media_type=source.media_type, headers=headers
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{source.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        source.iter_chunks(start, end),
+        status_code=206,
+        media_type=source.media_type,
+        headers=headers,
+    )
+
+def render_thumbnail(data: bytes, size: int, image_format: str) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets the JPEG decoder downscale by up to 8x while decoding, much cheaper
+        # than resizing after
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=THUMBNAIL_QUALITY)
+        return output.getvalue()
+
+async def thumbnail_source(
+    request: Request, source: FileSource, size: int
+) -> FileSource:
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"size must be one of {', '.join(str(s) for s in THUMBNAIL_SIZES)}"
+        )
+    if "image/webp" in request.headers.get("accept", ""):
+        image_format, media_type, extension = "WEBP", "image/webp", "webp"
+    else:
+        image_format, media_type, extension = "JPEG", "image/jpeg", "jpg"
+
+    def thumbnail(data: bytes) -> FileSource:
+        return FileSource(
+            etag=f'"{source.cache_id[:32]}-{size}-{extension}"',
+            modified=source.modified,
+            size=len(data),
+            media_type=media_type,
+            cache_id=thumbnail_key(source, size, image_format),
+            immutable=source.immutable,
+            reader=lambda start, end: iter_bytes(data, start, end),
+        )
+
+    # A revalidation doesn't need the thumbnail itself
+    probe = thumbnail(b"")
+    if etag_matches(request.headers.get("if-none-match"), probe.etag):
+        return probe
+    return thumbnail(await cached_thumbnail(source, size, image_format))
+
+def thumbnail_key(source: FileSource, size: int, image_format: str) -> str:
+    extension = "webp" if image_format == "WEBP" else "jpg"
+    return f"thumbnails/{source.cache_id[:2]}/{source.cache_id}-{size}.{extension}"
+
+async def cached_thumbnail(source: FileSource, size: int, image_format: str) -> bytes:
+    """The stored preview of source, rendered and stored first if needed."""
+    key = thumbnail_key(source, size, image_format)
+    data = await file_storage.read_bytes(key)
+    if data is None:
+        try:
+            data = await run_in_threadpool(
+                render_thumbnail, await source.read_bytes(), size, image_format
+            )
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            raise HTTPException(
+                status_code=415, detail="No preview available for this file"
+            ) from e
+        await file_storage.put_bytes(
+            key, data, "image/webp" if image_format == "WEBP" else "image/jpeg"
+        )
+    return data
+
+async def iter_bytes(
+    data: bytes, start: int = 0, end: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    yield data[start:None if end is None else end + 1]
+
+async def serve_file(
+    request: Request, source: FileSource, size: Optional[int] = None
+) -> Response:
+    """The file, or a preview of it no larger than size pixels."""
+    if size is None:
+        return serve_source(request, source)
+    return serve_source(
+        request, await thumbnail_source(request, source, size), vary="Accept"
+    )
@@ -0,0 +1,34 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.uploads import StagedUpload
+from storage import models
+from storage.backends import file_extension, file_storage
+from storage.queries import get_stored_file
+
+
+async def store_upload_transaction(
+    db: AsyncSession, specialist_id: int, kind: str, staged: StagedUpload
+):
+    """
+    Put a staged upload in blob storage and record it for the specialist (flush,
+    no commit).
+
+    The blob is written first; if the surrounding transaction is rolled back
+    it is left unreferenced, which is harmless since blobs are immutable and
+    shared by content.
+    """
+    await file_storage.put(staged)
+
+    stored = await get_stored_file(db, specialist_id, kind)
+    if stored is None:
+        stored = models.StoredFile(specialist_id=specialist_id, kind=kind)
+        db.add(stored)
+    stored.sha256 = staged.sha256
+    stored.extension = file_extension(staged.filename)
+    stored.size = staged.size
+    stored.content_type = staged.content_type
+    stored.original_filename = staged.filename[:255]
+    stored.rejected_reason = None
+
+    await db.flush()
+    return stored
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Settings are read at import time, so they must be in place before main is
+# imported: a throwaway database and storage root per test session
+TEST_DIR = tempfile.mkdtemp(prefix="drskin-tests-")
+os.environ["DR_SKIN_DATABASE_URL"] = f"sqlite+aiosqlite:///{TEST_DIR}/test.db"
+os.environ["DR_SKIN_STORAGE_ROOT"] = os.path.join(TEST_DIR, "storage")
+os.environ.setdefault("DR_SKIN_ENV", "dev")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_dir():
+    yield TEST_DIR
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    response = client.post(
+        "/auth/token",
+        data={
+            "username": main.DEFAULT_ADMIN_USERNAME,
+            "password": main.DEFAULT_ADMIN_PASSWORD,
+        },
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
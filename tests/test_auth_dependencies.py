@@ -0,0 +1,42 @@
+import pytest
+from fastapi import HTTPException
+
+import dependencies
+from auth.models import UserStatus, UserType
+from auth.principal import Principal
+
+
+def principal(user_type: UserType, status: UserStatus) -> Principal:
+    return Principal(
+        id=1,
+        username="someone",
+        user_type=user_type,
+        status=status,
+        is_active=status == UserStatus.ACTIVE,
+    )
+
+
+def test_require_specialist_accepts_active_specialist():
+    current = principal(UserType.SPECIALIST, UserStatus.ACTIVE)
+    assert dependencies.require_specialist(current) is current
+
+
+@pytest.mark.parametrize(
+    "user_type, status",
+    [
+        (UserType.SPECIALIST, UserStatus.PENDING),
+        (UserType.SPECIALIST, UserStatus.INACTIVE),
+        (UserType.ADMIN, UserStatus.ACTIVE),
+    ],
+)
+def test_require_specialist_rejects(user_type, status):
+    with pytest.raises(HTTPException) as raised:
+        dependencies.require_specialist(principal(user_type, status))
+    assert raised.value.status_code == 403
+
+
+def test_require_admin():
+    admin = principal(UserType.ADMIN, UserStatus.ACTIVE)
+    assert dependencies.require_admin(admin) is admin
+    with pytest.raises(HTTPException):
+        dependencies.require_admin(principal(UserType.SPECIALIST, UserStatus.ACTIVE))
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+
+from diagnosis.batching import MicroBatcher
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class BlockingBatcher(MicroBatcher):
+    """Inference that doesn't return until released, standing in for a slow model."""
+
+    def __init__(self):
+        super().__init__("densenet", max_wait_ms=0)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def _infer(self, images, timings=None):
+        self.started.set()
+        self.release.wait(5)
+        return [{"image": index} for index in range(len(images))]
+
+
+def test_batches_results_back_to_callers():
+    batcher = BlockingBatcher()
+    batcher.release.set()
+
+    async def scenario():
+        results = await asyncio.gather(*[batcher.submit(object()) for _ in range(3)])
+        await batcher.close()
+        return results
+
+    assert all("image" in result for result in run(scenario()))
+
+
+def test_close_cancels_batch_in_flight():
+    batcher = BlockingBatcher()
+
+    async def scenario():
+        request = asyncio.ensure_future(batcher.submit(object()))
+        while not batcher.started.is_set():
+            await asyncio.sleep(0.01)
+        await batcher.close()
+        try:
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(request, 1)
+        finally:
+            batcher.release.set()
+
+    run(scenario())
+
+
+def test_close_cancels_queued_requests():
+    batcher = BlockingBatcher()
+
+    async def scenario():
+        first = asyncio.ensure_future(batcher.submit(object()))
+        while not batcher.started.is_set():
+            await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(batcher.submit(object()))
+        await asyncio.sleep(0)
+        await batcher.close()
+        batcher.release.set()
+        for request in (first, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(request, 1)
+
+    run(scenario())
@@ -0,0 +1,139 @@
+"""
+Long polls on GET /diagnosis/jobs/{id} must not keep a pooled connection
+for the whole wait, or a handful of them starve every other request.
+"""
+import asyncio
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+import pytest
+from sqlalchemy import update
+
+import database
+import main
+from diagnosis.jobs import DIAGNOSIS_JOB, diagnosis_jobs
+from jobs.models import Job, JobStatus
+from jobs.worker import job_worker
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+async def request(method: str, path: str, query: str = "", form: dict = None):
+    """Call the app in the running event loop, as a server would, so calls overlap."""
+    body = urlencode(form).encode() if form else b""
+    headers = [(b"content-type", b"application/x-www-form-urlencoded")] if form else []
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": headers
+        + [(b"host", b"testserver"), (b"content-length", str(len(body)).encode())],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"body": b""}
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    await main.app(scope, receive, send)
+    return response["status"], json.loads(response["body"])
+
+
+@pytest.fixture
+def small_pool(client, monkeypatch):
+    """Sessions drawn from a two-connection pool that gives up after a second."""
+    # The job workers would compete for the pool too, and could still hold one
+    # of its connections when it is disposed
+    workers = (job_worker, diagnosis_jobs)
+    for worker in workers:
+        run(worker.shutdown())
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 2)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 1)
+    engine = database.create_engine_from_settings(database.SQLALCHEMY_DATABASE_URL)
+    database.AsyncSessionLocal.configure(bind=engine)
+    yield engine
+    database.AsyncSessionLocal.configure(bind=database.engine)
+    run(engine.dispose())
+    for worker in workers:
+        run(worker.start())
+
+
+async def running_job() -> Job:
+    # Already running, so no worker picks it up: it finishes when the test says so
+    async with database.AsyncSessionLocal() as db:
+        job = Job(
+            kind=DIAGNOSIS_JOB,
+            payload=json.dumps({"token": "a" * 32, "model_type": "densenet"}),
+            status=JobStatus.RUNNING,
+            attempts=1,
+            max_attempts=1,
+            run_after=datetime.utcnow(),
+        )
+        db.add(job)
+        await db.commit()
+        return job
+
+
+async def finish(job: Job):
+    """Finish the job the way another process would: only the row changes."""
+    async with database.AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job.id)
+            .values(
+                status=JobStatus.SUCCEEDED,
+                result=json.dumps({"ok": True}),
+                finished_at=datetime.utcnow(),
+            )
+        )
+        await db.commit()
+
+
+def test_long_polls_leave_the_pool_to_other_requests(small_pool):
+    async def scenario():
+        job = await running_job()
+        path = f"/diagnosis/jobs/{job.id}-{'a' * 32}"
+        polls = [
+            asyncio.ensure_future(request("GET", path, "wait=3")) for _ in range(3)
+        ]
+        await asyncio.sleep(0.3)
+        try:
+            login = await request(
+                "POST",
+                "/auth/token",
+                form={
+                    "username": main.DEFAULT_ADMIN_USERNAME,
+                    "password": main.DEFAULT_ADMIN_PASSWORD,
+                },
+            )
+            waiting = sum(not poll.done() for poll in polls)
+            await finish(job)
+        finally:
+            results = await asyncio.gather(*polls, return_exceptions=True)
+        return login, waiting, results
+
+    (login_status, _), waiting, polls = run(scenario())
+
+    assert login_status == 200
+    assert waiting == 3
+    for status_code, body in polls:
+        assert status_code == 200
+        assert body["status"] == "succeeded"
+        assert body["result"] == {"ok": True}
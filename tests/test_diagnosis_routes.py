@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/diagnosis/models", "/diagnosis/cache"])
+def test_internal_state_needs_admin(client, admin_headers, path):
+    assert client.get(path).status_code == 401
+    response = client.get(path, headers=admin_headers)
+    assert response.status_code == 200
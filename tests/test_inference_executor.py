@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from diagnosis.executor import InferenceExecutor, InferenceQueueFull
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def test_reserve_without_timeout_fails_fast():
+    executor = InferenceExecutor(max_queue_depth=2)
+
+    async def scenario():
+        async with executor.reserve(slots=2):
+            with pytest.raises(InferenceQueueFull):
+                async with executor.reserve():
+                    pass
+
+    run(scenario())
+    assert executor.in_flight == 0
+
+
+def test_reserve_waits_for_released_slots():
+    executor = InferenceExecutor(max_queue_depth=2)
+    order = []
+
+    async def holder(release: asyncio.Event):
+        async with executor.reserve(slots=2):
+            order.append("held")
+            await release.wait()
+        order.append("released")
+
+    async def scenario():
+        release = asyncio.Event()
+        task = asyncio.ensure_future(holder(release))
+        await asyncio.sleep(0)
+        asyncio.get_event_loop().call_later(0.05, release.set)
+        async with executor.reserve(timeout=5):
+            order.append("reserved")
+            assert executor.in_flight == 1
+        await task
+
+    run(scenario())
+    assert order == ["held", "released", "reserved"]
+    assert executor.in_flight == 0
+
+
+def test_reserve_times_out():
+    executor = InferenceExecutor(max_queue_depth=1)
+
+    async def scenario():
+        async with executor.reserve():
+            with pytest.raises(InferenceQueueFull):
+                async with executor.reserve(timeout=0.05):
+                    pass
+            assert executor.in_flight == 1
+
+    run(scenario())
+    assert executor.in_flight == 0
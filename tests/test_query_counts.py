@@ -0,0 +1,125 @@
+"""
+Listing endpoints load each page, users included, in a single SELECT
+whatever the page size (no N+1 lazy loads of Specialist.user / Admin.user).
+"""
+import asyncio
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import database
+from auth.models import User, UserStatus, UserType
+from dashboard.models import Admin
+from specialists.models import Specialist
+
+ROWS = 60
+LIMITS = (1, 10, 50)
+JOBS_TABLE = re.compile(r"\bjobs\b")
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # Connection setup and the job workers' polling aren't the request's work
+        if statement.lstrip().upper().startswith("PRAGMA"):
+            return
+        if JOBS_TABLE.search(statement):
+            return
+        statements.append(statement)
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", record)
+
+
+async def seed():
+    async with database.AsyncSessionLocal() as db:
+        for i in range(ROWS):
+            specialist_user = User(
+                username=f"qc-specialist-{i}",
+                email=f"qc-specialist-{i}@example.com",
+                hashed_password="x",
+                user_type=UserType.SPECIALIST,
+                status=UserStatus.ACTIVE,
+            )
+            admin_user = User(
+                username=f"qc-admin-{i}",
+                email=f"qc-admin-{i}@example.com",
+                hashed_password="x",
+                user_type=UserType.ADMIN,
+                status=UserStatus.ACTIVE,
+            )
+            db.add_all([
+                Specialist(
+                    user=specialist_user,
+                    license_number=f"LIC-{i}",
+                    specialization="Dermatology",
+                    name=f"Query Count {i}",
+                    phone_number=f"+2010000{i:05d}",
+                    hospital="General Hospital",
+                    bio="Skin doctor",
+                    is_approved=True,
+                ),
+                Admin(user=admin_user),
+            ])
+        await db.commit()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded(client):
+    # TestClient runs the app on this thread's event loop
+    asyncio.get_event_loop().run_until_complete(seed())
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_list_specialists_is_one_query(client, limit):
+    with count_statements() as statements:
+        response = client.get(
+            "/specialists/", params={"limit": limit, "is_approved": True}
+        )
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    assert all(item["user"]["username"] for item in response.json())
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_filter_specialists_is_one_query(client, limit):
+    with count_statements() as statements:
+        response = client.post(
+            "/specialists/filter",
+            params={"limit": limit},
+            json={"specialization": "Dermatology"},
+        )
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_search_specialists_is_one_query(client, limit):
+    with count_statements() as statements:
+        response = client.get(
+            "/specialists/search", params={"q": "query count", "limit": limit}
+        )
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_list_admins_loads_page_in_one_query(client, admin_headers, limit):
+    with count_statements() as statements:
+        response = client.get(
+            "/dashboard/admins", params={"limit": limit}, headers=admin_headers
+        )
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    # Resolving the caller may cost a lookup of its own; the page itself is one
+    assert len([s for s in statements if "FROM admins" in s]) == 1, statements
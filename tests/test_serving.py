@@ -0,0 +1,168 @@
+import io
+from typing import Optional
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from storage.serving import path_source, serve_file
+
+DATA = bytes(range(256)) * 4  # 1024 bytes
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "scan.pdf").write_bytes(DATA)
+    image = io.BytesIO()
+    Image.new("RGB", (600, 300), "red").save(image, format="PNG")
+    (tmp_path / "photo.png").write_bytes(image.getvalue())
+    return tmp_path
+
+
+@pytest.fixture
+def files_client(files):
+    app = FastAPI()
+
+    @app.get("/files/{filename}")
+    async def get_file(filename: str, request: Request, size: Optional[int] = None):
+        source = await path_source(files / filename)
+        if source is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return await serve_file(request, source, size)
+
+    return TestClient(app)
+
+
+def test_full_response_headers(files_client):
+    response = files_client.get("/files/scan.pdf")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-length"] == str(len(DATA))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["last-modified"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+
+def test_if_none_match_returns_304(files_client):
+    etag = files_client.get("/files/scan.pdf").headers["etag"]
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = files_client.get(
+            "/files/scan.pdf", headers={"If-None-Match": header}
+        )
+        assert response.status_code == 304, header
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+
+def test_if_none_match_mismatch_sends_file(files_client):
+    response = files_client.get("/files/scan.pdf", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_modified_since(files_client):
+    last_modified = files_client.get("/files/scan.pdf").headers["last-modified"]
+    response = files_client.get(
+        "/files/scan.pdf", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+    # An ETag, when sent, takes precedence over the date
+    response = files_client.get(
+        "/files/scan.pdf",
+        headers={"If-Modified-Since": last_modified, "If-None-Match": '"stale"'},
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "header, start, end",
+    [
+        ("bytes=0-99", 0, 99),
+        ("bytes=100-", 100, 1023),
+        ("bytes=1000-5000", 1000, 1023),
+        ("bytes=-24", 1000, 1023),
+        ("bytes=-5000", 0, 1023),
+    ],
+)
+def test_range(files_client, header, start, end):
+    response = files_client.get("/files/scan.pdf", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.content == DATA[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(DATA)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=5000-6000"])
+def test_range_past_end_returns_416(files_client, header):
+    response = files_client.get("/files/scan.pdf", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+@pytest.mark.parametrize(
+    "header", ["bytes=0-9,20-29", "bytes=50-10", "items=0-9", "bytes=abc-"]
+)
+def test_unsupported_or_invalid_range_sends_file(files_client, header):
+    response = files_client.get("/files/scan.pdf", headers={"Range": header})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range_current_etag_honours_range(files_client):
+    etag = files_client.get("/files/scan.pdf").headers["etag"]
+    response = files_client.get(
+        "/files/scan.pdf", headers={"Range": "bytes=0-9", "If-Range": etag}
+    )
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+
+
+@pytest.mark.parametrize("if_range", ['"stale"', "Wed, 21 Oct 2015 07:28:00 GMT"])
+def test_stale_if_range_sends_whole_file(files_client, if_range):
+    response = files_client.get(
+        "/files/scan.pdf", headers={"Range": "bytes=0-9", "If-Range": if_range}
+    )
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert "content-range" not in response.headers
+
+
+def test_stale_if_range_skips_416(files_client):
+    response = files_client.get(
+        "/files/scan.pdf", headers={"Range": "bytes=5000-", "If-Range": '"stale"'}
+    )
+    assert response.status_code == 200
+
+
+def test_missing_file(files_client):
+    assert files_client.get("/files/nothing.pdf").status_code == 404
+
+
+def test_thumbnail(files_client):
+    response = files_client.get(
+        "/files/photo.png", params={"size": 128}, headers={"Accept": "image/webp"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.size == (128, 64)
+
+    etag = response.headers["etag"]
+    revalidated = files_client.get(
+        "/files/photo.png",
+        params={"size": 128},
+        headers={"Accept": "image/webp", "If-None-Match": etag},
+    )
+    assert revalidated.status_code == 304
+
+    jpeg = files_client.get("/files/photo.png", params={"size": 128})
+    assert jpeg.headers["content-type"] == "image/jpeg"
+    assert jpeg.headers["etag"] != etag
+
+
+def test_thumbnail_rejects_unlisted_size(files_client):
+    assert files_client.get("/files/photo.png", params={"size": 100}).status_code == 400
@@ -0,0 +1,126 @@
+"""
+The listing filters match words (as prefixes) within their own column,
+through the full-text index, and phone numbers exactly.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+import database
+from auth.models import User, UserStatus, UserType
+from specialists.models import Specialist
+
+SPECIALISTS = [
+    ("Amira Hassan", "Dermatology", "Cairo University Hospital", "+201111000001"),
+    (
+        "Omar Farouk",
+        "Pediatric Dermatology",
+        "Alexandria Medical Center",
+        "+201111000002",
+    ),
+    ("Hassan Ali", "Cosmetic Surgery", "Cairo Skin Clinic", "+201111000003"),
+]
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+async def seed():
+    async with database.AsyncSessionLocal() as db:
+        for index, (name, specialization, hospital, phone) in enumerate(SPECIALISTS):
+            user = User(
+                username=f"filter-{index}",
+                email=f"filter-{index}@example.com",
+                hashed_password="x",
+                user_type=UserType.SPECIALIST,
+                status=UserStatus.ACTIVE,
+            )
+            db.add(Specialist(
+                user=user,
+                license_number=f"FLT-{index}",
+                specialization=specialization,
+                name=name,
+                phone_number=phone,
+                hospital=hospital,
+                bio="Filter test specialist",
+                is_approved=True,
+            ))
+        await db.commit()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded(client):
+    run(seed())
+
+
+def names(response):
+    assert response.status_code == 200, response.text
+    return sorted(
+        item["name"]
+        for item in response.json()
+        if item["bio"] == "Filter test specialist"
+    )
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        ({"name": "hassan"}, ["Amira Hassan", "Hassan Ali"]),
+        ({"name": "Has"}, ["Amira Hassan", "Hassan Ali"]),
+        # Words of the hospital don't count for the name filter
+        ({"name": "cairo"}, []),
+        ({"hospital": "cairo"}, ["Amira Hassan", "Hassan Ali"]),
+        ({"hospital": "cairo skin"}, ["Hassan Ali"]),
+        ({"specialization": "dermatology"}, ["Amira Hassan", "Omar Farouk"]),
+        ({"specialization": "dermatology", "hospital": "alexandria"}, ["Omar Farouk"]),
+        ({"phone_number": "+201111000003"}, ["Hassan Ali"]),
+        ({"phone_number": "+2011110000"}, []),
+        ({"name": "--"}, []),
+    ],
+)
+def test_filters(client, filters, expected):
+    assert names(client.get("/specialists/", params=filters)) == expected
+    assert names(client.post("/specialists/filter", json=filters)) == expected
+
+
+def test_filters_follow_updates(client):
+    async def rename():
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(
+                text(
+                    "UPDATE specialists SET hospital = 'Giza General'"
+                    " WHERE phone_number = '+201111000002'"
+                )
+            )
+            await db.commit()
+
+    run(rename())
+    assert names(client.post("/specialists/filter", json={"hospital": "giza"})) == [
+        "Omar Farouk"
+    ]
+    assert (
+        names(client.post("/specialists/filter", json={"hospital": "alexandria"})) == []
+    )
+
+
+def test_init_db_drops_obsolete_indexes(client):
+    async def scenario():
+        async with database.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_specialists_name"
+                    " ON specialists (name)"
+                )
+            )
+        await database.init_db()
+        async with database.engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index'")
+            )
+            return {row[0] for row in result}
+
+    indexes = run(scenario())
+    assert not indexes & set(database.OBSOLETE_INDEXES)
+    assert "ix_specialists_is_approved" in indexes
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+import pytest
+
+from auth.uploads import StagedUpload
+from storage import backends
+from storage.backends import LocalStorage, S3Storage, StorageNotAvailable, blob_key
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+async def collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+def stage(
+    directory: Path, data: bytes, content_type: str = "image/png"
+) -> StagedUpload:
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return StagedUpload(
+        Path(temp_name),
+        "photo.png",
+        len(data),
+        hashlib.sha256(data).hexdigest(),
+        content_type,
+    )
+
+
+def test_blob_key_is_sharded():
+    sha = hashlib.sha256(b"x").hexdigest()
+    assert blob_key(sha) == f"{sha[:2]}/{sha[2:4]}/{sha}"
+
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(str(tmp_path / "blobs"))
+
+
+def test_local_put_exists_read(local):
+    data = b"\x89PNG local blob"
+    staged = stage(local.staging_dir, data)
+    key = run(local.put(staged))
+
+    assert key == blob_key(staged.sha256)
+    assert local.path(key).is_file()
+    assert not staged.temp_path.exists()
+    assert run(local.exists(key))
+    assert run(local.read_bytes(key)) == data
+    assert run(collect(local.iter_chunks(key, 1, 4))) == data[1:5]
+    assert run(collect(local.iter_chunks(key, 5))) == data[5:]
+
+
+def test_local_missing_blob(local):
+    key = blob_key(hashlib.sha256(b"never stored").hexdigest())
+    assert not run(local.exists(key))
+    assert run(local.read_bytes(key)) is None
+
+
+def test_local_put_dedups_identical_content(local):
+    data = b"same bytes twice"
+    first = stage(local.staging_dir, data)
+    second = stage(local.staging_dir, data)
+    key = run(local.put(first))
+    modified = local.path(key).stat().st_mtime_ns
+
+    assert run(local.put(second)) == key
+    # The duplicate is dropped rather than written over the stored copy
+    assert not second.temp_path.exists()
+    assert local.path(key).stat().st_mtime_ns == modified
+    assert [p for p in local.root.rglob("*") if p.is_file()] == [local.path(key)]
+
+
+def test_local_put_bytes(local):
+    run(local.put_bytes("thumbnails/ab/thumb.webp", b"thumb"))
+    assert run(local.read_bytes("thumbnails/ab/thumb.webp")) == b"thumb"
+    assert list(local.staging_dir.iterdir()) == []
+
+
+def test_local_delete(local):
+    run(local.put_bytes("diagnosis/job", b"image"))
+    run(local.delete("diagnosis/job"))
+    assert not run(local.exists("diagnosis/job"))
+    # Already gone is fine
+    run(local.delete("diagnosis/job"))
+
+
+class FakeClientError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """The handful of boto3 S3 client calls S3Storage makes, over a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def _object(self, Bucket, Key):
+        try:
+            return self.objects[(Bucket, Key)]
+        except KeyError as e:
+            raise FakeClientError("404") from e
+
+    def head_object(self, Bucket, Key):
+        body, content_type = self._object(Bucket, Key)
+        return {"ContentLength": len(body), "ContentType": content_type}
+
+    def get_object(self, Bucket, Key, Range=None):
+        body, _ = self._object(Bucket, Key)
+        if Range is not None:
+            start, end = Range[len("bytes="):].split("-")
+            body = body[int(start):int(end) + 1 if end else None]
+        return {"Body": io.BytesIO(body)}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = (Body, ContentType)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        self.uploads += 1
+        with open(Filename, "rb") as f:
+            self.objects[(Bucket, Key)] = (
+                f.read(),
+                (ExtraArgs or {}).get("ContentType"),
+            )
+
+
+@pytest.fixture
+def fake_boto3(monkeypatch):
+    client = FakeS3Client()
+    boto3 = types.ModuleType("boto3")
+    boto3.client = lambda service, endpoint_url=None: client
+    botocore = types.ModuleType("botocore")
+    exceptions = types.ModuleType("botocore.exceptions")
+    exceptions.ClientError = FakeClientError
+    botocore.exceptions = exceptions
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    monkeypatch.setitem(sys.modules, "botocore", botocore)
+    monkeypatch.setitem(sys.modules, "botocore.exceptions", exceptions)
+    return client
+
+
+@pytest.fixture
+def s3(fake_boto3, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return S3Storage("bucket", "blobs/")
+
+
+def test_s3_put_exists_read(s3, fake_boto3):
+    data = b"\x89PNG s3 blob"
+    staged = stage(s3.staging_dir, data)
+    key = run(s3.put(staged))
+
+    assert key == blob_key(staged.sha256)
+    assert fake_boto3.objects[("bucket", "blobs/" + key)] == (data, "image/png")
+    assert not staged.temp_path.exists()
+    assert run(s3.exists(key))
+    assert run(s3.read_bytes(key)) == data
+    assert run(collect(s3.iter_chunks(key, 1, 4))) == data[1:5]
+    assert run(collect(s3.iter_chunks(key, 5))) == data[5:]
+
+
+def test_s3_missing_blob(s3):
+    key = blob_key(hashlib.sha256(b"never stored").hexdigest())
+    assert not run(s3.exists(key))
+    assert run(s3.read_bytes(key)) is None
+
+
+def test_s3_other_errors_propagate(s3, fake_boto3, monkeypatch):
+    def denied(**kwargs):
+        raise FakeClientError("AccessDenied")
+
+    monkeypatch.setattr(fake_boto3, "head_object", denied)
+    with pytest.raises(FakeClientError):
+        run(s3.exists("ab/cd/abcd"))
+
+
+def test_s3_put_dedups_identical_content(s3, fake_boto3):
+    data = b"same bytes twice"
+    first = stage(s3.staging_dir, data)
+    second = stage(s3.staging_dir, data)
+
+    assert run(s3.put(first)) == run(s3.put(second))
+    assert fake_boto3.uploads == 1
+    assert not second.temp_path.exists()
+
+
+def test_s3_put_bytes(s3, fake_boto3):
+    run(s3.put_bytes("thumbnails/ab/thumb.webp", b"thumb", "image/webp"))
+    assert fake_boto3.objects[("bucket", "blobs/thumbnails/ab/thumb.webp")] == (
+        b"thumb",
+        "image/webp",
+    )
+
+
+def test_s3_delete(s3):
+    run(s3.put_bytes("diagnosis/job", b"image"))
+    run(s3.delete("diagnosis/job"))
+    assert not run(s3.exists("diagnosis/job"))
+    run(s3.delete("diagnosis/job"))
+
+
+def test_s3_requires_bucket(fake_boto3):
+    with pytest.raises(StorageNotAvailable):
+        S3Storage("")
+
+
+def test_unknown_backend(monkeypatch):
+    monkeypatch.setattr(backends, "STORAGE_BACKEND", "ftp")
+    with pytest.raises(StorageNotAvailable):
+        backends.create_storage()
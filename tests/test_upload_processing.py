@@ -0,0 +1,143 @@
+"""
+Registration uploads are verified by a background job: files that aren't
+what they claim are unlinked from the profile and reported to the admins,
+and accepted ones get the extension of what they really are.
+"""
+import asyncio
+import io
+import json
+
+from PIL import Image
+from sqlalchemy import select
+
+import database
+from auth.notifications import NOTIFY_REJECTED_UPLOAD_JOB
+from jobs.models import Job, JobStatus
+from specialists.models import Specialist
+from storage.models import StoredFile
+from storage.processing import PROCESS_UPLOAD_JOB
+
+PDF = b"%PDF-1.4\n1 0 obj\n<<>>\nendobj\ntrailer\n<<>>\n%%EOF\n"
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def png() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(output, format="PNG")
+    return output.getvalue()
+
+
+def register(client, index: int, license_file, profile_image=None):
+    files = {"license_file": license_file}
+    if profile_image is not None:
+        files["profile_image"] = profile_image
+    response = client.post(
+        "/auth/specialist-register",
+        data={
+            "username": f"upload{index}",
+            "email": f"upload-{index}@example.com",
+            "password": "secret123",
+            "name": f"Upload Test {index}",
+            "phone_number": f"+20122200000{index}",
+            "license_number": f"UPL-{index}",
+            "specialization": "Dermatology",
+            "hospital": "Test Hospital",
+            "bio": "Upload test",
+        },
+        files=files,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+async def processed(user_id: int, timeout: float = 10):
+    """The specialist and its stored files once every job about them has finished."""
+    deadline = asyncio.get_event_loop().time() + timeout
+    while True:
+        async with database.AsyncSessionLocal() as db:
+            specialist = (
+                (
+                    await db.execute(
+                        select(Specialist).where(Specialist.user_id == user_id)
+                    )
+                )
+                .scalars()
+                .one()
+            )
+            stored = (
+                (
+                    await db.execute(
+                        select(StoredFile).where(
+                            StoredFile.specialist_id == specialist.id
+                        )
+                    )
+                )
+                .scalars()
+                .all()
+            )
+            ids = {f.id for f in stored}
+            jobs = [
+                job for job in (await db.execute(select(Job))).scalars().all()
+                if job.kind in (PROCESS_UPLOAD_JOB, NOTIFY_REJECTED_UPLOAD_JOB)
+                and json.loads(job.payload).get("stored_file_id") in ids
+            ]
+        done = all(
+            job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED) for job in jobs
+        )
+        if done and any(job.kind == PROCESS_UPLOAD_JOB for job in jobs):
+            return specialist, {f.kind: f for f in stored}, jobs
+        assert asyncio.get_event_loop().time() < deadline, [
+            (job.kind, job.status) for job in jobs
+        ]
+        await asyncio.sleep(0.05)
+
+
+def test_forged_license_is_unlinked_and_reported(client, admin_headers):
+    user_id = register(
+        client, 1, ("license.pdf", b"not a license at all", "application/pdf")
+    )
+    specialist, stored, jobs = run(processed(user_id))
+
+    assert specialist.license_file_path is None
+    assert "not an accepted file type" in stored["license"].rejected_reason
+    statuses = {job.kind: job.status for job in jobs}
+    assert statuses == {
+        PROCESS_UPLOAD_JOB: JobStatus.FAILED,
+        NOTIFY_REJECTED_UPLOAD_JOB: JobStatus.SUCCEEDED,
+    }
+
+    response = client.post(
+        f"/specialists/{specialist.id}/approve", headers=admin_headers
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Specialist has no valid license file"
+
+
+def test_extensions_are_corrected(client, admin_headers):
+    user_id = register(
+        client, 2,
+        ("scan.bin", PDF, "application/octet-stream"),
+        ("me.jpg", png(), "image/jpeg"),
+    )
+    specialist, stored, jobs = run(processed(user_id))
+
+    assert all(job.status == JobStatus.SUCCEEDED for job in jobs)
+    assert stored["license"].extension == ".pdf"
+    assert stored["license"].content_type == "application/pdf"
+    assert specialist.license_file_path == f"licenses/{stored['license'].sha256}.pdf"
+    assert stored["profile"].extension == ".png"
+    assert specialist.profile_image == f"profiles/{stored['profile'].sha256}.png"
+
+    response = client.get(
+        f"/auth/files/license/{stored['license'].sha256}.pdf", headers=admin_headers
+    )
+    assert response.status_code == 200
+    assert response.content == PDF
+
+    response = client.post(
+        f"/specialists/{specialist.id}/approve", headers=admin_headers
+    )
+    assert response.status_code == 200